@@ -0,0 +1,377 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import asyncio
+import argparse
+import importlib
+import statistics
+import tempfile
+from aiohttp import web
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+BENCH_CONFIG = """[telegram]
+API_ID = "1"
+API_HASH = "benchmark"
+BOT_TOKEN = "1:benchmark"
+
+[steam]
+STEAM_API_KEY = "benchmark"
+API_URL = "{url}"
+STORE_URL = "{url}"
+
+[storage]
+FLUSH_INTERVAL = 3600
+
+[monitor]
+MIN_POLL_INTERVAL = {interval}
+MAX_POLL_INTERVAL = {interval}
+RESUME_STAGGER = 0
+WORKERS = {workers}
+
+[ratelimit]
+REQUESTS_PER_SECOND = 100000
+BURST = 100000
+DAILY_BUDGET = 1000000000
+
+[delivery]
+QUEUE_SIZE = 1000000
+GLOBAL_RATE = 1000000
+CHAT_INTERVAL = 0
+
+[metrics]
+PORT = 0
+"""
+
+
+class FakeSteam:
+    def __init__(self, churn, latency=0, feed_file=None):
+        self.churn = churn
+        self.latency = latency
+        self.heads = {}
+        self.recorded = {}
+        self.requests = {}
+        self.epoch = int(time.time()) - 100000
+        if feed_file:
+            with open(feed_file, "r") as f:
+                self.recorded = json.load(f)
+        self.recorded_items = {i["publishedfileid"]: i for items in self.recorded.values() for i in items}
+
+    async def count(self, endpoint):
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def feed(self, appid, q_type):
+        if appid in self.recorded:
+            return self.recorded[appid]
+        key = (appid, q_type)
+        head = self.heads.get(key, 1000)
+        if random.random() < self.churn:
+            head += 1
+        self.heads[key] = head
+        base = int(appid) * 1000000
+        return [self.item(str(base + k)) for k in range(head, head - 100, -1)]
+
+    def item(self, pfid):
+        k = int(pfid) % 1000000
+        return {
+            "publishedfileid": pfid,
+            "result": 1,
+            "title": f"Item {pfid}",
+            "file_size": k * 65536,
+            "time_created": self.epoch + k,
+            "time_updated": self.epoch + k,
+            "subscriptions": k * 7,
+            "favorited": k,
+            "lifetime_subscriptions": k * 9,
+            "lifetime_favorited": k * 2,
+            "tags": [{"tag": "Benchmark"}, {"tag": "Synthetic"}],
+            "file_description": "Lorem ipsum dolor sit amet. " * 80,
+            "previews": [{"previewid": str(n), "url": f"https://example.com/{pfid}/{n}.jpg", "size": 65536}
+                         for n in range(8)],
+            "kv_tags": [{"key": "version", "value": str(k)}]
+        }
+
+    async def query_files(self, request):
+        await self.count("QueryFiles")
+        q = request.query
+        items = self.feed(q["appid"], q["query_type"])
+        start = 0 if q.get("cursor", "*") == "*" else int(q["cursor"])
+        size = int(q.get("numperpage", 10))
+        page = items[start:start + size]
+        return web.json_response({"response": {
+            "total": len(items),
+            "next_cursor": str(start + size),
+            "publishedfiledetails": page
+        }})
+
+    async def get_details(self, request):
+        await self.count("GetDetails")
+        ids = [v for k, v in request.query.items() if k.startswith("publishedfileids")]
+        details = [self.recorded_items.get(pfid) or self.item(pfid) for pfid in ids]
+        return web.json_response({"response": {"publishedfiledetails": details}})
+
+    async def appdetails(self, request):
+        await self.count("appdetails")
+        appid = request.query["appids"]
+        return web.json_response({appid: {"success": True, "data": {"type": "game", "name": f"Game {appid}"}}})
+
+    async def start(self, port):
+        web_app = web.Application()
+        web_app.router.add_get("/IPublishedFileService/QueryFiles/v1/", self.query_files)
+        web_app.router.add_get("/IPublishedFileService/GetDetails/v1/", self.get_details)
+        web_app.router.add_get("/api/appdetails", self.appdetails)
+        self.runner = web.AppRunner(web_app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", port).start()
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+class FakeMessage:
+    def __init__(self, msg_id):
+        self.id = msg_id
+
+
+class FakeClient:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, len(text)))
+        return FakeMessage(len(self.sent))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def load_bot(workdir, url, interval, workers):
+    with open(os.path.join(workdir, "config.ini"), "w") as f:
+        f.write(BENCH_CONFIG.format(url=url, interval=interval, workers=workers))
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    return importlib.import_module("main")
+
+
+def summarize(name, samples, elapsed=None, extra=""):
+    if not samples:
+        return {"scenario": name, "ops": 0}
+    ordered = sorted(samples)
+    q = statistics.quantiles(ordered, n=100) if len(ordered) > 1 else [ordered[0]] * 99
+    elapsed = elapsed if elapsed is not None else sum(ordered)
+    return {
+        "scenario": name,
+        "ops": len(ordered),
+        "ops_per_sec": len(ordered) / elapsed if elapsed else 0,
+        "p50_ms": q[49] * 1000,
+        "p99_ms": q[98] * 1000,
+        "extra": extra
+    }
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+
+def make_users_json(path, target_bytes, games_per_user):
+    users = {}
+    uid = 1
+    size = 0
+    while size < target_bytes:
+        games = {str(10 + (uid + g) % 500): f"Game {(uid + g) % 500}" for g in range(games_per_user)}
+        known = {gid: {str(int(gid) * 1000000 + k): 1700000000 + k for k in range(20)} for gid in games}
+        user = {
+            "games": games,
+            "filters_updated": {"size": [">", 1048576]},
+            "filters_new": {},
+            "known_items": known,
+            "last_items": {gid: str(int(gid) * 1000000 + 19) for gid in games},
+            "known_items_new": {},
+            "last_items_new": {},
+            "runtime": {"is_monitoring": False, "last_messages": {}, "user_mode": None,
+                        "send_updated_enabled": True, "send_new_enabled": True}
+        }
+        users[str(uid)] = user
+        size += len(json.dumps(user, indent=4)) + len(str(uid)) + 8
+        uid += 1
+    with open(path, "w") as f:
+        json.dump({"users": users}, f, indent=4)
+    return len(users), os.path.getsize(path)
+
+
+def bench_storage(m, args):
+    results = []
+    count, size = make_users_json(m.USERS_FILE, int(args.users_json_mb * 1024 * 1024), args.games)
+    migrate_time = timed(m.migrate_users_json)
+    results.append(summarize("storage.migrate_users_json", [migrate_time],
+                             extra=f"{count} users, {size / 1048576:.2f} MB"))
+    m.user_cache.clear()
+    user_ids = list(range(1, count + 1))
+    results.append(summarize("storage.get_user_data.cold", [timed(m.get_user_data, uid) for uid in user_ids]))
+    results.append(summarize("storage.get_send_updated_enabled.hot",
+                             [timed(m.get_send_updated_enabled, uid) for uid in user_ids]))
+    samples = []
+    for uid in user_ids:
+        gid = next(iter(m.load_games(uid)))
+        started = time.perf_counter()
+        m.set_last_publishedfileid(uid, gid, str(uid), int(time.time()))
+        samples.append(time.perf_counter() - started)
+    results.append(summarize("storage.set_last_publishedfileid", samples))
+    dirty = len(m.dirty_rows)
+    results.append(summarize("storage.flush_user_cache", [timed(m.flush_user_cache)], extra=f"{dirty} rows"))
+    return results
+
+
+def bench_filters(m, args):
+    rnd = random.Random(1)
+    user_ids = [20000000 + n for n in range(args.users)]
+    shared_ids = [30000000 + n for n in range(args.users)]
+    for uid in user_ids:
+        m.set_user_filter_updated(uid, "size", (">", rnd.randrange(1, 1024 ** 3)))
+        m.set_user_filter_updated(uid, "subs", ("<", rnd.randrange(1, 100000)))
+    for n, uid in enumerate(shared_ids):
+        if n % 5:
+            m.set_user_filter_updated(uid, "size", (">", (n % 5) * 1024 ** 2))
+    pages = [
+        [{"publishedfileid": str(n), "file_size": rnd.randrange(1, 2 * 1024 ** 3),
+          "subscriptions": rnd.randrange(0, 200000), "favorited": 0,
+          "lifetime_subscriptions": 0, "lifetime_favorited": 0}
+         for n in range(10)]
+        for _ in range(20)
+    ]
+    m.match_filters(user_ids + shared_ids, pages[0], "updated")
+    distinct = [timed(m.match_filters, user_ids, page, "updated") for page in pages]
+    shared = [timed(m.match_filters, shared_ids, page, "updated") for page in pages]
+    m.dirty_rows.clear()
+    return [
+        summarize("filters.match_filters.distinct", distinct, extra=f"{len(user_ids)} users x 10 items per call"),
+        summarize("filters.match_filters.shared", shared, extra=f"{len(shared_ids)} users in 5 filter sets")
+    ]
+
+
+async def bench_fetch(m, args):
+    samples = []
+    started = time.perf_counter()
+    for n in range(args.fetches):
+        t = time.perf_counter()
+        await m.fetch_workshop_items(21, str(10 + n % 50), "time_updated", None)
+        samples.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    return [summarize("steam.fetch_workshop_items", samples, elapsed)]
+
+
+async def bench_monitor(m, steam, args):
+    client = FakeClient()
+    batch_samples = []
+    m.MONITOR_BATCH_SECONDS.observe = lambda value, **labels: batch_samples.append(value)
+    poll_samples = []
+    m.FEED_POLL_SECONDS.observe = lambda value, **labels: poll_samples.append(value)
+    rnd = random.Random(2)
+    appids = [str(1000 + n) for n in range(args.appids)]
+    user_ids = [30000000 + n for n in range(args.users)]
+    for uid in user_ids:
+        m.save_games(uid, {gid: f"Game {gid}" for gid in rnd.sample(appids, args.games)})
+        m.set_monitoring_status(uid, True)
+    m.flush_user_cache()
+    steam.requests.clear()
+    if m.POLL_WORKERS:
+        m.start_poll_workers()
+        poll_task = asyncio.create_task(m.worker_results_loop())
+    else:
+        poll_task = asyncio.create_task(m.poll_feeds())
+    workers = [asyncio.create_task(m.delivery_worker(client)) for _ in range(m.DELIVERY_WORKERS)]
+    started = time.perf_counter()
+    await m.resume_monitors(client)
+    resume_time = time.perf_counter() - started
+    await asyncio.sleep(args.duration)
+    elapsed = time.perf_counter() - started
+    for task in list(m.running_tasks.values()):
+        task.cancel()
+    poll_task.cancel()
+    for w in workers:
+        w.cancel()
+    await asyncio.sleep(0)
+    m.stop_poll_workers()
+    requests = sum(steam.requests.values())
+    return [
+        summarize("monitor.resume_monitors", [resume_time], extra=f"{len(user_ids)} users"),
+        summarize("monitor.feed_poll", poll_samples, elapsed,
+                  extra=f"{requests} Steam requests ({requests / elapsed:.1f}/s) for "
+                        f"{len(user_ids)} users x {args.games} games"),
+        summarize("monitor.user_batch", batch_samples, elapsed),
+        summarize("monitor.delivery", [1] * len(client.sent), elapsed,
+                  extra=f"{len(client.sent)} messages sent, {m.delivery_pending} pending"),
+    ]
+
+
+def print_results(results):
+    print(f"{'scenario':38} {'ops':>9} {'ops/s':>12} {'p50 ms':>10} {'p99 ms':>10}  notes")
+    for r in results:
+        if not r.get("ops"):
+            print(f"{r['scenario']:38} {0:>9}")
+            continue
+        p50 = f"{r['p50_ms']:.3f}" if r["scenario"] != "monitor.delivery" else "-"
+        p99 = f"{r['p99_ms']:.3f}" if r["scenario"] != "monitor.delivery" else "-"
+        print(f"{r['scenario']:38} {r['ops']:>9} {r['ops_per_sec']:>12.1f} {p50:>10} {p99:>10}  {r['extra']}")
+
+
+async def run(args):
+    port = free_port()
+    steam = FakeSteam(args.churn, args.latency / 1000, args.feed_file)
+    await steam.start(port)
+    workdir = tempfile.mkdtemp(prefix="workshop-bench-")
+    m = load_bot(workdir, f"http://127.0.0.1:{port}", args.interval, args.workers)
+    results = []
+    try:
+        if args.scenario in ("all", "storage"):
+            results.extend(bench_storage(m, args))
+        if args.scenario in ("all", "filters"):
+            results.extend(bench_filters(m, args))
+        if args.scenario in ("all", "fetch"):
+            results.extend(await bench_fetch(m, args))
+        if args.scenario in ("all", "monitor"):
+            results.extend(await bench_monitor(m, steam, args))
+    finally:
+        await m.close_http_session()
+        await steam.stop()
+        m.close_storage()
+        m.db.close()
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks against a local Steam and Telegram stand-in.")
+    parser.add_argument("--scenario", choices=["all", "storage", "filters", "fetch", "monitor"], default="all")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--games", type=int, default=5)
+    parser.add_argument("--appids", type=int, default=200)
+    parser.add_argument("--users-json-mb", type=float, default=1)
+    parser.add_argument("--fetches", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--interval", type=float, default=2)
+    parser.add_argument("--workers", type=int, default=0, help="Poll worker processes, 0 polls in-process")
+    parser.add_argument("--churn", type=float, default=0.3)
+    parser.add_argument("--latency", type=float, default=0, help="Simulated Steam round trip in milliseconds")
+    parser.add_argument("--feed-file", help="JSON mapping appid to a recorded publishedfiledetails list")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
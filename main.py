@@ -1,13 +1,28 @@
 import os
+import random
 import configparser
 import asyncio
+import codecs
+import concurrent.futures
+import heapq
+import io
 import json
-import requests
+import multiprocessing
+import queue
+import sqlite3
+import struct
+import aiohttp
 import re
-from pyrogram import Client, filters
+import signal
+import sys
+import time
+import zlib
+from aiohttp import web
+from collections import OrderedDict, deque
+from pyrogram import Client, filters, idle
 from pyrogram.types import BotCommand, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from pyrogram.enums import ParseMode
-from pyrogram.errors import MessageNotModified
+from pyrogram.errors import FloodWait, MessageNotModified
 
 GAME_LIST_HEADER = "<b>Steam games list:</b>"
 GAME_LIST_EMPTY = "No games added yet."
@@ -22,6 +37,20 @@ REMOVE_GAME_NOT_FOUND = "Game [ <code>{game_id}</code> ] is not in your list."
 INVALID_ADD_FORMAT = "Invalid format. Use: <code>add GAME_ID</code> or <code>add URL</code>"
 INVALID_REMOVE_FORMAT = "Incorrect format. Use: <code>rm GAME_ID</code>"
 WORKSHOP_CHECK_FAILED = "Could not check if the game has a Steam Workshop."
+BULK_ADD_RESULT = "Added <b>{added}</b> of <b>{total}</b> games. {duplicates} already in your list."
+BULK_ADD_FAILED = "Not added (invalid, not a game or no Steam Workshop): {game_ids}"
+BULK_ADD_UNRECOGNIZED = "Skipped entries that are not game IDs or store URLs: {count}."
+BULK_ADD_TRUNCATED = "Only the first {limit} entries were imported."
+IMPORT_FILE_INVALID = "Could not read the file. Send a text file with game IDs or URLs, or a file made by <code>export</code>."
+IMPORT_FILTERS_DONE = "Filters were imported too."
+EXPORT_CAPTION = "Your games and filters. Send this file back to the bot to import them."
+EXPORT_FILE_NAME = "steam_workshop_export.json"
+TOP_GAMES_HEADER = "<b>Top watched games:</b>"
+TOP_GAMES_LINE = "{rank}. [ <code>{game_id}</code> ] - {game_name}: <b>{users}</b> users ({updated} updated, {new} new)"
+TOP_GAMES_EMPTY = "No games are watched yet."
+IMPORT_MAX_BYTES = 1048576
+IMPORT_MAX_GAMES = 200
+IMPORT_CONCURRENCY = 2
 MONITORING_STARTED = "Monitoring started."
 MONITORING_ALREADY_RUNNING = "Monitoring is already running."
 MONITORING_NO_GAMES = "You have no games added for monitoring."
@@ -38,6 +67,11 @@ WORKSHOP_ITEM_MESSAGE = (
     "<b>🔗 [ <a href=\"{item_url}\">View Item</a> ]</b>"
 )
 
+DIGEST_HEADER = "<b>📦 [ {feed_name} ] Digest – {count} items{page}</b>\n\n"
+DIGEST_SEPARATOR = "\n\n➖➖➖➖➖\n\n"
+MESSAGE_LIMIT = 4096
+DIGEST_HEADER_RESERVE = 100
+
 SET_MENU_TEMPLATE = (
     "{game_list_header}\n"
     "{game_list}\n\n"
@@ -55,6 +89,8 @@ WELCOME_MESSAGE = (
     "• <b>Add Game:</b> Add a game to your list for monitoring by sending:\n"
     "  - <code>add GAME_ID</code>\n"
     "  - or <code>add URL</code>\n"
+    "  - or several IDs/URLs at once, or a text/JSON file with them\n"
+    "• <b>Export:</b> Send <code>export</code> to get your games and filters as a file you can import again.\n"
     "• <b>Remove Game:</b> Remove a game from your list by sending:\n"
     "  - <code>rm GAME_ID</code>\n"
     "• <b>Settings:</b> Configure filters for updates based on parameters such as:\n"
@@ -62,6 +98,7 @@ WELCOME_MESSAGE = (
     "  - Subscriptions\n"
     "  - Favorites\n"
     "  Use commands like <code>set size >100mb</code> or <code>reset</code> to adjust or clear filters.\n"
+    "  Turn on <b>Digest</b> to receive several items combined in one message.\n"
     "• <b>Run/Stop Monitoring:</b> Inline buttons to start or stop monitoring your selected games.\n\n"
     "<b>How to Start:</b>\n"
     "1️⃣ Add a game by typing <code>add GAME_ID</code> or pasting the game URL.\n"
@@ -85,6 +122,7 @@ SETTINGS_SUBMENU_TEXT_UPDATED = (
     "<code>ltfavs</code> <b>- Lifetime favorited</b></blockquote>\n\n"
     "⚙️ <b>Operators:</b> [ <code>></code>  ] <b>and</b> [ <code><</code>  ]\n"
     "📐 <b>Use</b> [ <code>kb</code>  ][ <code>mb</code>  ][ <code>gb</code>  ] <b>for size</b>\n\n"
+    "📦 <b>Digest mode groups several items into one message.</b>\n\n"
     "<b>To reset all filters, type:</b> <code>Reset</code>"
 )
 
@@ -103,6 +141,7 @@ SETTINGS_SUBMENU_TEXT_NEW = (
     "<code>ltfavs</code> <b>- Lifetime favorited</b></blockquote>\n\n"
     "⚙️ <b>Operators:</b> [ <code>></code>  ] <b>and</b> [ <code><</code>  ]\n"
     "📐 <b>Use</b> [ <code>kb</code>  ][ <code>mb</code>  ][ <code>gb</code>  ] <b>for size</b>\n\n"
+    "📦 <b>Digest mode groups several items into one message.</b>\n\n"
     "<b>To reset all filters, type:</b> <code>Reset</code>"
 )
 
@@ -113,190 +152,759 @@ api_id = int(config['telegram']['API_ID'].strip('"'))
 api_hash = config['telegram']['API_HASH'].strip('"')
 bot_token = config['telegram']['BOT_TOKEN'].strip('"')
 steam_api_key = config["steam"]["STEAM_API_KEY"].strip('"')
+STEAM_API_URL = config.get("steam", "API_URL", fallback="https://api.steampowered.com").strip('"')
+STORE_API_URL = config.get("steam", "STORE_URL", fallback="https://store.steampowered.com").strip('"')
+APP_CACHE_TTL = config.getfloat("steam", "APP_CACHE_TTL", fallback=7 * 86400)
+APP_CACHE_NEGATIVE_TTL = config.getfloat("steam", "APP_CACHE_NEGATIVE_TTL", fallback=86400)
+APP_LIST_FILE = config.get("steam", "APP_LIST_FILE", fallback="").strip('"')
+HTTP_TIMEOUT = config.getfloat("http", "TIMEOUT", fallback=15)
+APPDETAILS_TIMEOUT = config.getfloat("http", "APPDETAILS_TIMEOUT", fallback=10)
+HTTP_MAX_CONNECTIONS = config.getint("http", "MAX_CONNECTIONS", fallback=20)
+HTTP_MAX_CONCURRENCY = config.getint("http", "MAX_CONCURRENCY", fallback=10)
+STEAM_REQUESTS_PER_SECOND = config.getfloat("ratelimit", "REQUESTS_PER_SECOND", fallback=5)
+STEAM_BURST = config.getint("ratelimit", "BURST", fallback=10)
+STEAM_DAILY_BUDGET = config.getint("ratelimit", "DAILY_BUDGET", fallback=100000)
+STEAM_MAX_RETRIES = config.getint("ratelimit", "MAX_RETRIES", fallback=4)
+STEAM_BACKOFF_BASE = config.getfloat("ratelimit", "BACKOFF_BASE", fallback=1)
+STEAM_BACKOFF_MAX = config.getfloat("ratelimit", "BACKOFF_MAX", fallback=60)
+DELIVERY_QUEUE_SIZE = config.getint("delivery", "QUEUE_SIZE", fallback=10000)
+DELIVERY_WORKERS = config.getint("delivery", "WORKERS", fallback=4)
+GLOBAL_SEND_RATE = config.getfloat("delivery", "GLOBAL_RATE", fallback=25)
+CHAT_SEND_INTERVAL = config.getfloat("delivery", "CHAT_INTERVAL", fallback=1)
+DELIVERY_DRAIN_TIMEOUT = config.getfloat("delivery", "DRAIN_TIMEOUT", fallback=10)
+METRICS_HOST = config.get("metrics", "HOST", fallback="127.0.0.1").strip('"')
+METRICS_PORT = config.getint("metrics", "PORT", fallback=9464)
+ADMIN_IDS = [int(uid) for uid in config.get("admin", "IDS", fallback="").strip('"').replace(",", " ").split()]
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DIGEST_WINDOW = config.getfloat("digest", "WINDOW", fallback=300)
+DIGEST_MAX_ITEMS = config.getint("digest", "MAX_ITEMS", fallback=20)
 
 app = Client("my_bot", api_id=api_id, api_hash=api_hash, bot_token=bot_token)
 
 running_tasks = {}
 USERS_FILE = "users.json"
-
-if not os.path.exists(USERS_FILE):
-    with open(USERS_FILE, "w") as f:
-        json.dump({"users": {}}, f)
+DB_FILE = "users.db"
+FEEDS = ("updated", "new")
+FLUSH_INTERVAL = config.getint("storage", "FLUSH_INTERVAL", fallback=5)
+CHECKPOINT_INTERVAL = config.getint("storage", "CHECKPOINT_INTERVAL", fallback=300)
+
+MIN_POLL_INTERVAL = config.getfloat("monitor", "MIN_POLL_INTERVAL", fallback=10)
+MAX_POLL_INTERVAL = config.getfloat("monitor", "MAX_POLL_INTERVAL", fallback=600)
+POLL_RATE_FACTOR = config.getfloat("monitor", "POLL_RATE_FACTOR", fallback=0.25)
+FEED_QUERIES = {"updated": (21, "time_updated"), "new": (1, "time_created")}
+FEED_SORT_KEYS = {q_type: sort_key for q_type, sort_key in FEED_QUERIES.values()}
+FEED_NAMES = {q_type: feed for feed, (q_type, _) in FEED_QUERIES.items()}
+POLL_PAGE_SIZE = config.getint("monitor", "POLL_PAGE_SIZE", fallback=10)
+MAX_POLL_PAGES = config.getint("monitor", "MAX_POLL_PAGES", fallback=5)
+RESUME_STAGGER = config.getfloat("monitor", "RESUME_STAGGER", fallback=30)
+POLL_WORKERS = config.getint("monitor", "WORKERS", fallback=0)
+POLL_CONCURRENCY = config.getint("monitor", "POLL_CONCURRENCY", fallback=10)
+DETAILS_BATCH_SIZE = 100
+QUERY_FILES_FIELDS = (
+    'publishedfileid', 'time_updated', 'time_created', 'title', 'file_size', 'subscriptions', 'favorited',
+    'lifetime_subscriptions', 'lifetime_favorited'
+)
+QUERY_FILES_CHUNK = 65536
+KNOWN_ITEMS_CAP = config.getint("known_items", "DEFAULT", fallback=100)
+FILTER_FIELDS = {
+    "size": "file_size",
+    "subs": "subscriptions",
+    "favs": "favorited",
+    "ltsubs": "lifetime_subscriptions",
+    "ltfavs": "lifetime_favorited"
+}
+FILTER_INDEX = {f_name: idx for idx, f_name in enumerate(FILTER_FIELDS)}
+ITEM_DETAILS_CACHE_SIZE = config.getint("monitor", "ITEM_DETAILS_CACHE_SIZE", fallback=1000)
+RENDER_CACHE_BYTES = config.getint("monitor", "RENDER_CACHE_BYTES", fallback=4 * 1024 * 1024)
+
+user_cache = {}
+dirty_rows = set()
+db_writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+writer_db = None
+compiled_filters = {}
+game_index = {}
+feed_subscribers = {}
+feed_heap = []
+feed_due = {}
+feed_intervals = {}
+feed_marks = {}
+feed_wakeup = asyncio.Event()
+poll_semaphore = asyncio.Semaphore(POLL_CONCURRENCY)
+import_semaphore = asyncio.Semaphore(IMPORT_CONCURRENCY)
+user_queues = {}
+poll_workers = []
+worker_results = None
+item_details = OrderedDict()
+rendered_messages = OrderedDict()
+rendered_bytes = 0
+details_inflight = {}
+http_session = None
+http_semaphore = asyncio.Semaphore(HTTP_MAX_CONCURRENCY)
+steam_stats = {
+    "requests": 0,
+    "throttled": 0,
+    "rate_limited": 0,
+    "retried": 0,
+    "failed": 0,
+    "budget_exhausted": 0,
+    "budget_used": 0,
+    "budget_day": None
+}
+delivery_chats = {}
+digest_buffers = {}
+delivery_ready = []
+delivery_next = {}
+delivery_pending = 0
+delivery_wakeup = asyncio.Event()
+delivery_stats = {
+    "queued": 0,
+    "sent": 0,
+    "dropped": 0,
+    "flood_waits": 0,
+    "failed": 0
+}
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        metrics_registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def merge(self, values):
+        for key, val in values.items():
+            self.values[key] = self.values.get(key, 0) + val
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, val in self.values.items():
+            lines.append(f"{self.name}{format_labels(key)} {val}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.values = {}
+        metrics_registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        counts = self.values.get(key)
+        if counts is None:
+            counts = self.values[key] = [[0] * len(self.buckets), 0, 0.0]
+        for n, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[0][n] += 1
+        counts[1] += 1
+        counts[2] += value
+
+    def merge(self, values):
+        for key, (bucket_counts, count, total) in values.items():
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for n, c in enumerate(bucket_counts):
+                counts[0][n] += c
+            counts[1] += count
+            counts[2] += total
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, (bucket_counts, count, total) in self.values.items():
+            for bound, c in zip(self.buckets, bucket_counts):
+                lines.append(f"{self.name}_bucket{format_labels(key + (('le', bound),))} {c}")
+            lines.append(f"{self.name}_bucket{format_labels(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(key)} {count}")
+        return lines
+
+
+def format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in key) + "}"
+
+
+def render_metrics():
+    lines = []
+    for m in metrics_registry:
+        lines.extend(m.render())
+    gauges = {
+        "bot_running_tasks": len(running_tasks),
+        "bot_feed_subscriptions": len(feed_subscribers),
+        "bot_indexed_games": len(game_index),
+        "bot_cached_users": len(user_cache),
+        "bot_dirty_rows": len(dirty_rows),
+        "bot_delivery_pending": delivery_pending,
+        "bot_steam_budget_used": steam_stats["budget_used"],
+    }
+    for name, val in gauges.items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {val}")
+    for prefix, stats in (("bot_steam", steam_stats), ("bot_delivery", delivery_stats)):
+        for k, val in stats.items():
+            if not k.startswith("budget_"):
+                lines.append(f"# TYPE {prefix}_{k}_total counter")
+                lines.append(f"{prefix}_{k}_total {val}")
+    return "\n".join(lines) + "\n"
+
+
+metrics_registry = []
+STEAM_REQUEST_SECONDS = Histogram("bot_steam_request_seconds", "Steam request duration by endpoint")
+STEAM_RESPONSES = Counter("bot_steam_responses", "Steam responses by endpoint and status")
+FEED_POLL_SECONDS = Histogram("bot_feed_poll_seconds", "Time to fetch one workshop feed")
+MONITOR_BATCH_SECONDS = Histogram("bot_monitor_batch_seconds", "Time for a user monitor to process one feed result")
+ITEMS_DIFFED = Counter("bot_items_diffed", "Items past a user cursor by feed")
+NOTIFICATIONS = Counter("bot_notifications", "Notification decisions by feed and result")
+RENDER_CACHE = Counter("bot_render_cache", "Rendered message cache lookups by result")
+STORAGE_SECONDS = Histogram("bot_storage_seconds", "Storage read and flush duration by operation")
+STORAGE_BYTES = Counter("bot_storage_bytes", "Bytes read from and written to storage by operation")
+STORAGE_ROWS = Counter("bot_storage_rows", "Rows written by storage flushes")
+
+db = sqlite3.connect(DB_FILE)
+db.execute("PRAGMA journal_mode=WAL")
+db.execute("PRAGMA synchronous=NORMAL")
+db.executescript("""
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    filters_updated TEXT NOT NULL DEFAULT '{}',
+    filters_new TEXT NOT NULL DEFAULT '{}',
+    runtime TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS games (
+    user_id INTEGER NOT NULL,
+    appid TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (user_id, appid)
+);
+CREATE INDEX IF NOT EXISTS games_appid ON games (appid);
+CREATE TABLE IF NOT EXISTS game_state (
+    user_id INTEGER NOT NULL,
+    appid TEXT NOT NULL,
+    feed TEXT NOT NULL,
+    last_item TEXT,
+    known_items TEXT NOT NULL DEFAULT '{}',
+    PRIMARY KEY (user_id, appid, feed)
+);
+CREATE INDEX IF NOT EXISTS game_state_appid ON game_state (appid);
+""")
+
+SCHEMA_MIGRATIONS = [
+    "ALTER TABLE game_state ADD COLUMN last_time INTEGER",
+    """CREATE TABLE app_cache (
+        appid TEXT PRIMARY KEY,
+        type TEXT,
+        name TEXT,
+        fetched_at REAL,
+        has_workshop INTEGER,
+        workshop_checked_at REAL
+    )""",
+]
+
+
+def migrate_schema():
+    version = db.execute("PRAGMA user_version").fetchone()[0]
+    for n, stmt in enumerate(SCHEMA_MIGRATIONS[version:], start=version + 1):
+        with db:
+            db.execute(stmt)
+            db.execute(f"PRAGMA user_version = {n}")
+
+
+migrate_schema()
+
+
+def default_runtime():
+    return {
+        "is_monitoring": False,
+        "last_messages": {},
+        "user_mode": None,
+        "send_updated_enabled": True,
+        "send_new_enabled": True
+    }
 
 
-def load_all_data():
+def migrate_users_json():
+    if not os.path.exists(USERS_FILE):
+        return
+    if db.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+        return
     with open(USERS_FILE, "r") as f:
-        return json.load(f)
+        users = json.load(f).get("users", {})
+    with db:
+        for uid, u in users.items():
+            db.execute(
+                "INSERT INTO users (user_id, filters_updated, filters_new, runtime) VALUES (?, ?, ?, ?)",
+                (int(uid), json.dumps(u.get("filters_updated", {})), json.dumps(u.get("filters_new", {})),
+                 json.dumps(u.get("runtime", default_runtime())))
+            )
+            db.executemany(
+                "INSERT INTO games (user_id, appid, name) VALUES (?, ?, ?)",
+                [(int(uid), gid, gn) for gid, gn in u.get("games", {}).items()]
+            )
+            for feed, last_key, known_key in (("updated", "last_items", "known_items"),
+                                              ("new", "last_items_new", "known_items_new")):
+                last_items = u.get(last_key, {})
+                known_items = u.get(known_key, {})
+                for gid in set(last_items) | set(known_items):
+                    db.execute(
+                        "INSERT INTO game_state (user_id, appid, feed, last_item, known_items) VALUES (?, ?, ?, ?, ?)",
+                        (int(uid), gid, feed, last_items.get(gid), json.dumps(known_items.get(gid, {})))
+                    )
+    os.replace(USERS_FILE, USERS_FILE + ".migrated")
+    print(f"Migrated {len(users)} users from {USERS_FILE} to {DB_FILE}")
+
+
+migrate_users_json()
+
+
+class KnownItems:
+    __slots__ = ("times", "heap", "cap")
+
+    def __init__(self, cap, items=()):
+        self.times = {}
+        self.heap = []
+        self.cap = max(1, cap)
+        for pfid, ts in items:
+            self.add(pfid, ts)
+
+    def __len__(self):
+        return len(self.times)
+
+    def get(self, pfid, default=0):
+        return self.times.get(int(pfid), default)
+
+    def add(self, pfid, ts):
+        pfid = int(pfid)
+        self.times[pfid] = ts
+        heapq.heappush(self.heap, (ts, pfid))
+        while len(self.times) > self.cap:
+            oldest_ts, oldest = heapq.heappop(self.heap)
+            if self.times.get(oldest) != oldest_ts:
+                continue
+            if oldest == pfid:
+                heapq.heappush(self.heap, (oldest_ts, oldest))
+                break
+            del self.times[oldest]
+        if len(self.heap) > 2 * max(self.cap, len(self.times)):
+            self.heap = [(t, p) for p, t in self.times.items()]
+            heapq.heapify(self.heap)
+
+    def encode(self):
+        n = len(self.times)
+        return struct.pack(f"<{n}Q{n}I", *self.times.keys(), *self.times.values())
+
+    @classmethod
+    def decode(cls, raw, cap):
+        if isinstance(raw, str):
+            return cls(cap, ((pfid, ts) for pfid, ts in json.loads(raw).items()))
+        n = len(raw) // 12
+        unpacked = struct.unpack(f"<{n}Q{n}I", raw)
+        return cls(cap, zip(unpacked[:n], unpacked[n:]))
+
+
+def known_items_cap(game_id):
+    return config.getint("known_items", str(game_id), fallback=KNOWN_ITEMS_CAP)
+
+
+def load_user_rows(user_id):
+    started = time.perf_counter()
+    row = db.execute(
+        "SELECT filters_updated, filters_new, runtime FROM users WHERE user_id = ?", (int(user_id),)
+    ).fetchone()
+    if row is None:
+        return None
+    STORAGE_SECONDS.observe(time.perf_counter() - started, op="read")
+    STORAGE_BYTES.inc(sum(len(c) for c in row), op="read")
+    return {
+        "filters_updated": json.loads(row[0]),
+        "filters_new": json.loads(row[1]),
+        "runtime": json.loads(row[2]),
+        "games": None,
+        "state": None
+    }
+
 
+def load_user_games(user_id):
+    started = time.perf_counter()
+    games = db.execute("SELECT appid, name FROM games WHERE user_id = ? ORDER BY rowid", (int(user_id),)).fetchall()
+    STORAGE_SECONDS.observe(time.perf_counter() - started, op="read")
+    STORAGE_BYTES.inc(sum(len(gn) for _, gn in games), op="read")
+    return {gid: gn for gid, gn in games}
 
-def save_all_data(data):
-    with open(USERS_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+
+def load_user_state(user_id):
+    started = time.perf_counter()
+    rows = db.execute(
+        "SELECT appid, feed, last_item, last_time, known_items FROM game_state WHERE user_id = ?", (int(user_id),)
+    )
+    state = {}
+    size = 0
+    for gid, feed, li, lt, ki in rows:
+        known_items = KnownItems.decode(ki, known_items_cap(gid))
+        state[(gid, feed)] = {"last_item": li, "last_time": lt, "known_items": known_items}
+        size += len(ki)
+    STORAGE_SECONDS.observe(time.perf_counter() - started, op="read")
+    STORAGE_BYTES.inc(size, op="read")
+    return state
 
 
 def get_user_data(user_id):
-    data = load_all_data()
-    users = data.get("users", {})
-    user_id_str = str(user_id)
-    if user_id_str not in users:
-        users[user_id_str] = {
-            "games": {},
-            "filters_updated": {},
-            "filters_new": {},
-            "known_items": {},
-            "last_items": {},
-            "known_items_new": {},
-            "last_items_new": {},
-            "runtime": {
-                "is_monitoring": False,
-                "last_messages": {},
-                "user_mode": None,
-                "send_updated_enabled": True,
-                "send_new_enabled": True
+    uid = int(user_id)
+    user_data = user_cache.get(uid)
+    if user_data is None:
+        user_data = load_user_rows(uid)
+        if user_data is None:
+            user_data = {
+                "filters_updated": {},
+                "filters_new": {},
+                "runtime": default_runtime(),
+                "games": {},
+                "state": {}
             }
-        }
-        data["users"] = users
-        save_all_data(data)
-    return data, users[user_id_str]
+            dirty_rows.add(("user", uid))
+        user_cache[uid] = user_data
+    return user_data
+
+
+def get_user_games(user_id):
+    user_data = get_user_data(user_id)
+    if user_data["games"] is None:
+        user_data["games"] = load_user_games(user_id)
+    return user_data["games"]
+
+
+def get_user_state(user_id):
+    user_data = get_user_data(user_id)
+    if user_data["state"] is None:
+        user_data["state"] = load_user_state(user_id)
+    return user_data["state"]
+
+
+def mark_dirty(*key):
+    dirty_rows.add(key)
+
+
+def snapshot_dirty_rows():
+    rows = list(dirty_rows)
+    dirty_rows.clear()
+    batch = []
+    for key in rows:
+        user_data = user_cache[key[1]]
+        if key[0] == "user":
+            values = (json.dumps(user_data["filters_updated"]), json.dumps(user_data["filters_new"]),
+                      json.dumps(user_data["runtime"]))
+        elif key[0] == "games":
+            values = list(user_data["games"].items())
+        else:
+            st = user_data["state"].get((key[2], key[3]))
+            values = None if st is None else (st["last_item"], st["last_time"], st["known_items"].encode())
+        batch.append((key, values))
+    return batch
+
+
+def get_writer_db():
+    global writer_db
+    if writer_db is None:
+        writer_db = sqlite3.connect(DB_FILE)
+        writer_db.execute("PRAGMA synchronous=NORMAL")
+    return writer_db
+
+
+def write_row(conn, key, values):
+    uid = key[1]
+    if key[0] == "user":
+        conn.execute(
+            "INSERT OR REPLACE INTO users (user_id, filters_updated, filters_new, runtime) VALUES (?, ?, ?, ?)",
+            (uid,) + values
+        )
+        return sum(len(v) for v in values)
+    if key[0] == "games":
+        conn.execute("DELETE FROM games WHERE user_id = ?", (uid,))
+        conn.executemany(
+            "INSERT INTO games (user_id, appid, name) VALUES (?, ?, ?)",
+            [(uid, gid, gn) for gid, gn in values]
+        )
+        return sum(len(gid) + len(gn) for gid, gn in values)
+    if values is None:
+        conn.execute("DELETE FROM game_state WHERE user_id = ? AND appid = ? AND feed = ?", (uid, key[2], key[3]))
+        return 0
+    conn.execute(
+        "INSERT OR REPLACE INTO game_state (user_id, appid, feed, last_item, last_time, known_items) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (uid, key[2], key[3]) + values
+    )
+    return len(values[2])
+
+
+def write_rows(batch):
+    conn = get_writer_db()
+    try:
+        with conn:
+            return sum(write_row(conn, key, values) for key, values in batch)
+    except sqlite3.OperationalError:
+        raise
+    except Exception:
+        pass
+    size = 0
+    for key, values in batch:
+        try:
+            with conn:
+                size += write_row(conn, key, values)
+        except sqlite3.OperationalError:
+            raise
+        except Exception as e:
+            print(f"write_rows: dropping {key}: {e}")
+    return size
+
+
+def checkpoint_db():
+    get_writer_db().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def flush_done(batch, started, size):
+    STORAGE_SECONDS.observe(time.perf_counter() - started, op="flush")
+    STORAGE_BYTES.inc(size, op="flush")
+    STORAGE_ROWS.inc(len(batch))
+
+
+def flush_failed(batch):
+    dirty_rows.update(key for key, _ in batch)
+
+
+def flush_user_cache():
+    if not dirty_rows:
+        return
+    started = time.perf_counter()
+    batch = snapshot_dirty_rows()
+    try:
+        size = db_writer.submit(write_rows, batch).result()
+    except Exception:
+        flush_failed(batch)
+        raise
+    flush_done(batch, started, size)
+
+
+async def flush_loop():
+    last_checkpoint = time.monotonic()
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        if dirty_rows:
+            started = time.perf_counter()
+            batch = snapshot_dirty_rows()
+            try:
+                size = await asyncio.wrap_future(db_writer.submit(write_rows, batch))
+            except Exception as e:
+                flush_failed(batch)
+                print("flush_user_cache error:", e)
+            else:
+                flush_done(batch, started, size)
+        if time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL:
+            last_checkpoint = time.monotonic()
+            try:
+                await asyncio.wrap_future(db_writer.submit(checkpoint_db))
+            except Exception as e:
+                print("checkpoint_db error:", e)
+
+
+def close_storage():
+    try:
+        flush_user_cache()
+        db_writer.submit(checkpoint_db).result()
+    finally:
+        db_writer.shutdown(wait=True)
+
+
+def get_game_state(user_id, game_id, feed):
+    return get_user_state(user_id).setdefault(
+        (game_id, feed), {"last_item": None, "last_time": None, "known_items": KnownItems(known_items_cap(game_id))}
+    )
+
+
+def set_game_state(user_id, game_id, feed, **fields):
+    get_game_state(user_id, game_id, feed).update(fields)
+    mark_dirty("state", int(user_id), game_id, feed)
 
 
-def save_user_data(user_id, user_data):
-    data = load_all_data()
-    data["users"][str(user_id)] = user_data
-    save_all_data(data)
+def clear_game_state(user_id, game_id=None, feed=None):
+    state = get_user_state(user_id)
+    for gid, f in list(state):
+        if (game_id is None or gid == game_id) and (feed is None or f == feed):
+            del state[(gid, f)]
+            mark_dirty("state", int(user_id), gid, f)
 
 
 def user_is_known(user_id):
-    data = load_all_data()
-    return str(user_id) in data.get("users", {})
+    if int(user_id) in user_cache:
+        return True
+    return db.execute("SELECT 1 FROM users WHERE user_id = ?", (int(user_id),)).fetchone() is not None
 
 
 def add_user_to_known(user_id):
-    _, _ = get_user_data(user_id)
+    get_user_data(user_id)
 
 
 def load_games(user_id):
-    _, user_data = get_user_data(user_id)
-    return user_data.get("games", {})
+    return dict(get_user_games(user_id))
 
 
 def save_games(user_id, games):
-    data, user_data = get_user_data(user_id)
-    user_data["games"] = games
-    save_user_data(user_id, user_data)
+    old_games = list(get_user_games(user_id))
+    get_user_data(user_id)["games"] = dict(games)
+    mark_dirty("games", int(user_id))
+    index_user(user_id, old_games)
+
+
+def remove_game_data(user_id, game_id):
+    games = get_user_games(user_id)
+    if game_id in games:
+        del games[game_id]
+        mark_dirty("games", int(user_id))
+    clear_game_state(user_id, game_id)
+    index_user(user_id, [game_id])
+
+
+def unindex_user(uid, game_ids):
+    for gid in game_ids:
+        watchers = game_index.get(gid)
+        if watchers is not None:
+            watchers.pop(uid, None)
+            if not watchers:
+                del game_index[gid]
+
+
+def index_user(user_id, old_games=()):
+    uid = int(user_id)
+    unindex_user(uid, old_games)
+    if not is_user_monitoring(uid):
+        unindex_user(uid, get_user_games(uid))
+        return
+    feeds = tuple(feed for feed, on in (("updated", get_send_updated_enabled(uid)),
+                                        ("new", get_send_new_enabled(uid))) if on)
+    for gid in get_user_games(uid):
+        game_index.setdefault(gid, {})[uid] = feeds
+
+
+def rebuild_game_index():
+    started = time.monotonic()
+    flush_user_cache()
+    game_index.clear()
+    rows = db.execute(
+        "SELECT g.appid, g.user_id, COALESCE(json_extract(u.runtime, '$.send_updated_enabled'), 1), "
+        "COALESCE(json_extract(u.runtime, '$.send_new_enabled'), 1) "
+        "FROM games g JOIN users u ON u.user_id = g.user_id "
+        "WHERE json_extract(u.runtime, '$.is_monitoring')"
+    )
+    for gid, uid, upd, new in rows:
+        game_index.setdefault(gid, {})[uid] = tuple(feed for feed, on in (("updated", upd), ("new", new)) if on)
+    print(f"Indexed {len(game_index)} games in {time.monotonic() - started:.2f}s")
+
+
+def watched_feeds(user_id, game_id):
+    return game_index.get(game_id, {}).get(int(user_id), ())
+
+
+def top_watched_games(limit):
+    ranked = sorted(game_index.items(), key=lambda kv: len(kv[1]), reverse=True)[:limit]
+    return [
+        (gid, len(watchers), sum("updated" in f for f in watchers.values()), sum("new" in f for f in watchers.values()))
+        for gid, watchers in ranked
+    ]
 
 
 def load_user_filters_updated(user_id):
-    _, user_data = get_user_data(user_id)
-    return user_data.get("filters_updated", {})
+    return get_user_data(user_id)["filters_updated"]
 
 
 def save_user_filters_updated(user_id, filters_data):
-    data, user_data = get_user_data(user_id)
-    user_data["filters_updated"] = filters_data
-    save_user_data(user_id, user_data)
+    get_user_data(user_id)["filters_updated"] = filters_data
+    compiled_filters.pop((int(user_id), "updated"), None)
+    mark_dirty("user", int(user_id))
 
 
 def load_user_filters_new(user_id):
-    _, user_data = get_user_data(user_id)
-    return user_data.get("filters_new", {})
+    return get_user_data(user_id)["filters_new"]
 
 
 def save_user_filters_new(user_id, filters_data):
-    data, user_data = get_user_data(user_id)
-    user_data["filters_new"] = filters_data
-    save_user_data(user_id, user_data)
+    get_user_data(user_id)["filters_new"] = filters_data
+    compiled_filters.pop((int(user_id), "new"), None)
+    mark_dirty("user", int(user_id))
 
 
 def set_user_filter_updated(user_id, filter_name, filter_data):
-    data, user_data = get_user_data(user_id)
-    f = user_data.get("filters_updated", {})
+    f = load_user_filters_updated(user_id)
     if filter_data is None:
         if filter_name in f:
             del f[filter_name]
     else:
         f[filter_name] = filter_data
-    user_data["filters_updated"] = f
-    user_data["known_items"] = {}
-    user_data["last_items"] = {}
-    save_user_data(user_id, user_data)
+    save_user_filters_updated(user_id, f)
 
 
 def set_user_filter_new(user_id, filter_name, filter_data):
-    data, user_data = get_user_data(user_id)
-    f = user_data.get("filters_new", {})
+    f = load_user_filters_new(user_id)
     if filter_data is None:
         if filter_name in f:
             del f[filter_name]
     else:
         f[filter_name] = filter_data
-    user_data["filters_new"] = f
-    user_data["known_items_new"] = {}
-    user_data["last_items_new"] = {}
-    save_user_data(user_id, user_data)
+    save_user_filters_new(user_id, f)
 
 
 def load_game_items_info(user_id, game_id):
-    _, user_data = get_user_data(user_id)
-    return user_data.get("known_items", {}).get(game_id, {})
+    return get_game_state(user_id, game_id, "updated")["known_items"]
 
 
 def save_game_items_info(user_id, game_id, items_dict):
-    data, user_data = get_user_data(user_id)
-    known_items = user_data.get("known_items", {})
-    known_items[game_id] = items_dict
-    user_data["known_items"] = known_items
-    save_user_data(user_id, user_data)
+    set_game_state(user_id, game_id, "updated", known_items=items_dict)
 
 
 def load_game_items_info_new(user_id, game_id):
-    _, user_data = get_user_data(user_id)
-    return user_data.get("known_items_new", {}).get(game_id, {})
+    return get_game_state(user_id, game_id, "new")["known_items"]
 
 
 def save_game_items_info_new(user_id, game_id, items_dict):
-    data, user_data = get_user_data(user_id)
-    known_items_new = user_data.get("known_items_new", {})
-    known_items_new[game_id] = items_dict
-    user_data["known_items_new"] = known_items_new
-    save_user_data(user_id, user_data)
+    set_game_state(user_id, game_id, "new", known_items=items_dict)
 
 
 def get_last_publishedfileid(user_id, game_id):
-    _, user_data = get_user_data(user_id)
-    return user_data.get("last_items", {}).get(game_id)
+    return get_game_state(user_id, game_id, "updated")["last_item"]
+
+
+def set_last_publishedfileid(user_id, game_id, file_id, file_time=None):
+    set_game_state(user_id, game_id, "updated", last_item=file_id, last_time=file_time)
 
 
-def set_last_publishedfileid(user_id, game_id, file_id):
-    data, user_data = get_user_data(user_id)
-    last_items = user_data.get("last_items", {})
-    last_items[game_id] = file_id
-    user_data["last_items"] = last_items
-    save_user_data(user_id, user_data)
+def get_last_item_time(user_id, game_id):
+    return get_game_state(user_id, game_id, "updated")["last_time"]
 
 
 def get_last_publishedfileid_new(user_id, game_id):
-    _, user_data = get_user_data(user_id)
-    return user_data.get("last_items_new", {}).get(game_id)
+    return get_game_state(user_id, game_id, "new")["last_item"]
+
+
+def set_last_publishedfileid_new(user_id, game_id, file_id, file_time=None):
+    set_game_state(user_id, game_id, "new", last_item=file_id, last_time=file_time)
 
 
-def set_last_publishedfileid_new(user_id, game_id, file_id):
-    data, user_data = get_user_data(user_id)
-    last_items_new = user_data.get("last_items_new", {})
-    last_items_new[game_id] = file_id
-    user_data["last_items_new"] = last_items_new
-    save_user_data(user_id, user_data)
+def get_last_item_time_new(user_id, game_id):
+    return get_game_state(user_id, game_id, "new")["last_time"]
 
 
 def get_user_runtime_data(user_id):
-    _, user_data = get_user_data(user_id)
-    return user_data.setdefault("runtime", {})
+    return get_user_data(user_id)["runtime"]
 
 
 def save_user_runtime_data(user_id, runtime_data):
-    data, user_data = get_user_data(user_id)
-    user_data["runtime"] = runtime_data
-    save_user_data(user_id, user_data)
+    get_user_data(user_id)["runtime"] = runtime_data
+    mark_dirty("user", int(user_id))
 
 
 def get_last_message_id(user_id, command):
@@ -335,6 +943,7 @@ def set_monitoring_status(user_id, status_bool):
     r = get_user_runtime_data(user_id)
     r["is_monitoring"] = status_bool
     save_user_runtime_data(user_id, r)
+    index_user(user_id)
 
 
 def is_user_monitoring(user_id):
@@ -351,6 +960,8 @@ def set_send_updated_enabled(user_id, status):
     r = get_user_runtime_data(user_id)
     r["send_updated_enabled"] = status
     save_user_runtime_data(user_id, r)
+    index_user(user_id)
+    resubscribe_feed(user_id, "updated", status)
 
 
 def get_send_new_enabled(user_id):
@@ -362,6 +973,30 @@ def set_send_new_enabled(user_id, status):
     r = get_user_runtime_data(user_id)
     r["send_new_enabled"] = status
     save_user_runtime_data(user_id, r)
+    index_user(user_id)
+    resubscribe_feed(user_id, "new", status)
+
+
+def get_digest_updated_enabled(user_id):
+    r = get_user_runtime_data(user_id)
+    return r.get("digest_updated", False)
+
+
+def set_digest_updated_enabled(user_id, status):
+    r = get_user_runtime_data(user_id)
+    r["digest_updated"] = status
+    save_user_runtime_data(user_id, r)
+
+
+def get_digest_new_enabled(user_id):
+    r = get_user_runtime_data(user_id)
+    return r.get("digest_new", False)
+
+
+def set_digest_new_enabled(user_id, status):
+    r = get_user_runtime_data(user_id)
+    r["digest_new"] = status
+    save_user_runtime_data(user_id, r)
 
 
 def format_filters(filters_dict):
@@ -426,62 +1061,57 @@ def parse_filter_command(command_str):
     return None
 
 
-def check_filters_updated(user_id, item):
-    f_dict = load_user_filters_updated(user_id)
-    if not f_dict:
-        return True
-    fs = int(item.get('file_size', 0))
-    sb = int(item.get('subscriptions', 0))
-    fv = int(item.get('favorited', 0))
-    ls = int(item.get('lifetime_subscriptions', 0))
-    lf = int(item.get('lifetime_favorited', 0))
+def compile_filters(f_dict):
+    checks = []
     for f_name, (op, val) in f_dict.items():
-        actual = None
-        if f_name == 'size':
-            actual = fs
-        elif f_name == 'subs':
-            actual = sb
-        elif f_name == 'favs':
-            actual = fv
-        elif f_name == 'ltsubs':
-            actual = ls
-        elif f_name == 'ltfavs':
-            actual = lf
-        if op == '>' and not (actual >= val):
-            return False
-        if op == '<' and not (actual <= val):
-            return False
-    return True
+        if f_name in FILTER_FIELDS:
+            checks.append((FILTER_INDEX[f_name], op == '>', val))
+    return tuple(checks)
 
 
-def check_filters_new(user_id, item):
-    f_dict = load_user_filters_new(user_id)
-    if not f_dict:
-        return True
-    fs = int(item.get('file_size', 0))
-    sb = int(item.get('subscriptions', 0))
-    fv = int(item.get('favorited', 0))
-    ls = int(item.get('lifetime_subscriptions', 0))
-    lf = int(item.get('lifetime_favorited', 0))
-    for f_name, (op, val) in f_dict.items():
-        actual = None
-        if f_name == 'size':
-            actual = fs
-        elif f_name == 'subs':
-            actual = sb
-        elif f_name == 'favs':
-            actual = fv
-        elif f_name == 'ltsubs':
-            actual = ls
-        elif f_name == 'ltfavs':
-            actual = lf
-        if op == '>' and not (actual >= val):
-            return False
-        if op == '<' and not (actual <= val):
+def get_compiled_filters(user_id, feed):
+    key = (int(user_id), feed)
+    checks = compiled_filters.get(key)
+    if checks is None:
+        if feed == "updated":
+            checks = compile_filters(load_user_filters_updated(user_id))
+        else:
+            checks = compile_filters(load_user_filters_new(user_id))
+        compiled_filters[key] = checks
+    return checks
+
+
+def filter_values(item):
+    values = item.get('_filter_values')
+    if values is None:
+        values = tuple(int(item.get(field, 0)) for field in FILTER_FIELDS.values())
+        item['_filter_values'] = values
+    return values
+
+
+def item_passes(checks, values):
+    for idx, greater, val in checks:
+        if greater:
+            if values[idx] < val:
+                return False
+        elif values[idx] > val:
             return False
     return True
 
 
+def match_filters(user_ids, items, feed):
+    values = [(i.get('publishedfileid'), filter_values(i)) for i in items]
+    by_checks = {}
+    matches = {}
+    for uid in user_ids:
+        checks = get_compiled_filters(uid, feed)
+        passed = by_checks.get(checks)
+        if passed is None:
+            passed = by_checks[checks] = frozenset(pfid for pfid, v in values if item_passes(checks, v))
+        matches[uid] = passed
+    return matches
+
+
 async def delete_last_message(user_id, command, client, chat_id):
     msg_id = get_last_message_id(user_id, command)
     if msg_id:
@@ -537,37 +1167,233 @@ async def show_settings_menu(client, user_id, message=None, text_prefix=""):
     set_last_message_id(user_id, "settings", sent.id)
 
 
-def is_valid_game(game_id):
+def get_http_session():
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=HTTP_MAX_CONNECTIONS, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT)
+        )
+    return http_session
+
+
+async def close_http_session():
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+
+
+class SteamBudgetExceeded(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        waited = False
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                waited = True
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return waited
+            waited = True
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+steam_limiter = TokenBucket(STEAM_REQUESTS_PER_SECOND, STEAM_BURST)
+send_limiter = TokenBucket(GLOBAL_SEND_RATE, GLOBAL_SEND_RATE)
+
+
+def use_daily_budget():
+    day = time.strftime("%Y-%m-%d", time.gmtime())
+    if steam_stats["budget_day"] != day:
+        steam_stats["budget_day"] = day
+        steam_stats["budget_used"] = 0
+    if steam_stats["budget_used"] >= STEAM_DAILY_BUDGET:
+        steam_stats["budget_exhausted"] += 1
+        raise SteamBudgetExceeded(f"Daily Steam API budget of {STEAM_DAILY_BUDGET} requests used up")
+    steam_stats["budget_used"] += 1
+
+
+def retry_delay(r, attempt):
+    retry_after = r.headers.get("Retry-After", "")
+    if retry_after.isdigit():
+        return min(int(retry_after), STEAM_BACKOFF_MAX)
+    return random.uniform(0, min(STEAM_BACKOFF_MAX, STEAM_BACKOFF_BASE * 2 ** attempt))
+
+
+def steam_endpoint(url):
+    parts = url.rstrip("/").split("/")
+    if len(parts) > 1 and re.match(r"^v\d+$", parts[-1]):
+        return parts[-2]
+    return parts[-1]
+
+
+async def steam_get(url, params=None, timeout=None, parse=None):
+    if params:
+        params = {k: int(v) if isinstance(v, bool) else v for k, v in params.items()}
+    req_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+    endpoint = steam_endpoint(url)
+    attempt = 0
+    while True:
+        use_daily_budget()
+        if await steam_limiter.acquire():
+            steam_stats["throttled"] += 1
+        steam_stats["requests"] += 1
+        delay = None
+        async with http_semaphore:
+            started = time.perf_counter()
+            status = "error"
+            try:
+                async with get_http_session().get(url, params=params, timeout=req_timeout) as r:
+                    status = r.status
+                    if (r.status == 429 or r.status >= 500) and attempt < STEAM_MAX_RETRIES:
+                        delay = retry_delay(r, attempt)
+                        if r.status == 429:
+                            steam_stats["rate_limited"] += 1
+                            steam_limiter.pause(delay)
+                    else:
+                        r.raise_for_status()
+                        if parse is not None:
+                            return await parse(r)
+                        return await r.json(content_type=None)
+            finally:
+                STEAM_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+                STEAM_RESPONSES.inc(endpoint=endpoint, status=status)
+        steam_stats["retried"] += 1
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+def get_cached_app(app_id):
+    return db.execute(
+        "SELECT type, name, fetched_at, has_workshop, workshop_checked_at FROM app_cache WHERE appid = ?",
+        (str(app_id),)
+    ).fetchone()
+
+
+def write_app_details(app_id, app_type, name, fetched_at):
+    conn = get_writer_db()
+    with conn:
+        conn.execute(
+            "INSERT INTO app_cache (appid, type, name, fetched_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (appid) DO UPDATE SET type = excluded.type, name = excluded.name, "
+            "fetched_at = excluded.fetched_at",
+            (app_id, app_type, name, fetched_at)
+        )
+
+
+def write_workshop_exists(app_id, has_workshop, checked_at):
+    conn = get_writer_db()
+    with conn:
+        conn.execute(
+            "INSERT INTO app_cache (appid, has_workshop, workshop_checked_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (appid) DO UPDATE SET has_workshop = excluded.has_workshop, "
+            "workshop_checked_at = excluded.workshop_checked_at",
+            (app_id, has_workshop, checked_at)
+        )
+
+
+def write_app_rows(rows):
+    conn = get_writer_db()
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO app_cache (appid, type, name, fetched_at, has_workshop, workshop_checked_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+
+
+def cache_app_details(app_id, app_type, name):
+    return asyncio.wrap_future(db_writer.submit(write_app_details, str(app_id), app_type, name, time.time()))
+
+
+def cache_workshop_exists(app_id, has_workshop):
+    return asyncio.wrap_future(db_writer.submit(write_workshop_exists, str(app_id), int(has_workshop), time.time()))
+
+
+def app_cache_fresh(checked_at, positive):
+    if checked_at is None:
+        return False
+    return time.time() - checked_at < (APP_CACHE_TTL if positive else APP_CACHE_NEGATIVE_TTL)
+
+
+def prewarm_app_cache():
+    if not APP_LIST_FILE or not os.path.exists(APP_LIST_FILE):
+        return
+    with open(APP_LIST_FILE, "r") as f:
+        apps = json.load(f)
+    now = time.time()
+    rows = []
+    for a in apps:
+        if "appid" not in a or "type" not in a:
+            continue
+        if a["type"] == "game" and not a.get("name"):
+            continue
+        has_workshop = a.get("has_workshop")
+        rows.append((
+            str(a["appid"]), a["type"], a.get("name"), now,
+            None if has_workshop is None else int(has_workshop),
+            None if has_workshop is None else now
+        ))
+    db_writer.submit(write_app_rows, rows).result()
+    print(f"Pre-warmed app cache with {len(rows)} apps from {APP_LIST_FILE}")
+
+
+async def is_valid_game(game_id):
+    cached = get_cached_app(game_id)
+    if cached and app_cache_fresh(cached[2], cached[0] == "game") and (cached[0] != "game" or cached[1]):
+        app_type, name = cached[0], cached[1]
+        if app_type is None:
+            return False, "Game ID not found."
+        if app_type == "game":
+            return True, name
+        return False, f"Type is {app_type}"
     try:
-        url = f"https://store.steampowered.com/api/appdetails?appids={game_id}"
-        r = requests.get(url)
-        if r.status_code == 200:
-            d = r.json()
-            if d[str(game_id)]["success"]:
-                app_data = d[str(game_id)]["data"]
-                if app_data["type"] == "game":
-                    return True, app_data["name"]
-                else:
-                    return False, f"Type is {app_data['type']}"
+        d = await steam_get(f"{STORE_API_URL}/api/appdetails", {"appids": game_id}, timeout=APPDETAILS_TIMEOUT)
+        if d[str(game_id)]["success"]:
+            app_data = d[str(game_id)]["data"]
+            await cache_app_details(game_id, app_data["type"], app_data["name"])
+            if app_data["type"] == "game":
+                return True, app_data["name"]
             else:
-                return False, "Game ID not found."
+                return False, f"Type is {app_data['type']}"
         else:
-            return False, f"HTTP Error {r.status_code}"
+            await cache_app_details(game_id, None, None)
+            return False, "Game ID not found."
+    except aiohttp.ClientResponseError as e:
+        return False, f"HTTP Error {e.status}"
     except:
         return False, "Exception occurred during game validation."
 
 
-def check_workshop_exists(app_id, api_key):
-    u = "https://api.steampowered.com/IPublishedFileService/QueryFiles/v1/"
+async def check_workshop_exists(app_id, api_key):
+    cached = get_cached_app(app_id)
+    if cached and cached[3] is not None and app_cache_fresh(cached[4], bool(cached[3])):
+        return bool(cached[3])
+    u = f"{STEAM_API_URL}/IPublishedFileService/QueryFiles/v1/"
     p = {"key": api_key, "appid": app_id, "query_type": 0, "numperpage": 1}
     try:
-        r = requests.get(u, params=p)
-        r.raise_for_status()
-        d = r.json()
+        d = await steam_get(u, p)
         total_items = d.get("response", {}).get("total", 0)
-        return total_items > 0
     except:
         return None
+    await cache_workshop_exists(app_id, total_items > 0)
+    return total_items > 0
 
 
 @app.on_message(filters.private & filters.command("start"))
@@ -646,19 +1472,34 @@ async def open_settings_submenu_callback(client, callback_query: CallbackQuery):
     await callback_query.message.edit_text(text=text, parse_mode=ParseMode.HTML, reply_markup=kb)
 
 
+def settings_submenu_keyboard_updated(user_id):
+    status_btn_text = "Last Updated: ON ✅" if get_send_updated_enabled(user_id) else "Last Updated: OFF ❌"
+    digest_btn_text = "Digest: ON 📦" if get_digest_updated_enabled(user_id) else "Digest: OFF ✉️"
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(status_btn_text, callback_data="toggle_send_updated")],
+        [InlineKeyboardButton(digest_btn_text, callback_data="toggle_digest_updated")],
+        [InlineKeyboardButton("◀️ Back", callback_data="back_to_settings_main")]
+    ])
+
+
+def settings_submenu_keyboard_new(user_id):
+    status_btn_text = "Most Recent: ON ✅" if get_send_new_enabled(user_id) else "Most Recent: OFF ❌"
+    digest_btn_text = "Digest: ON 📦" if get_digest_new_enabled(user_id) else "Digest: OFF ✉️"
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(status_btn_text, callback_data="toggle_send_new")],
+        [InlineKeyboardButton(digest_btn_text, callback_data="toggle_digest_new")],
+        [InlineKeyboardButton("◀️ Back", callback_data="back_to_settings_main")]
+    ])
+
+
 @app.on_callback_query(filters.regex("^open_settings_submenu_updated$"))
 async def open_settings_submenu_updated(client, callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
     set_user_mode(user_id, "settings_submenu_updated")
     filters_upd = load_user_filters_updated(user_id)
     current_filters_text = format_filters(filters_upd)
-    updated_enabled = get_send_updated_enabled(user_id)
-    status_btn_text = "Last Updated: ON ✅" if updated_enabled else "Last Updated: OFF ❌"
     text = SETTINGS_SUBMENU_TEXT_UPDATED.format(current_filters=current_filters_text)
-    kb = InlineKeyboardMarkup([
-        [InlineKeyboardButton(status_btn_text, callback_data="toggle_send_updated")],
-        [InlineKeyboardButton("◀️ Back", callback_data="back_to_settings_main")]
-    ])
+    kb = settings_submenu_keyboard_updated(user_id)
     await callback_query.message.edit_text(text=text, parse_mode=ParseMode.HTML, reply_markup=kb)
 
 
@@ -668,13 +1509,8 @@ async def open_settings_submenu_new(client, callback_query: CallbackQuery):
     set_user_mode(user_id, "settings_submenu_new")
     filters_n = load_user_filters_new(user_id)
     current_filters_text = format_filters(filters_n)
-    new_enabled = get_send_new_enabled(user_id)
-    status_btn_text = "Most Recent: ON ✅" if new_enabled else "Most Recent: OFF ❌"
     text = SETTINGS_SUBMENU_TEXT_NEW.format(current_filters=current_filters_text)
-    kb = InlineKeyboardMarkup([
-        [InlineKeyboardButton(status_btn_text, callback_data="toggle_send_new")],
-        [InlineKeyboardButton("◀️ Back", callback_data="back_to_settings_main")]
-    ])
+    kb = settings_submenu_keyboard_new(user_id)
     await callback_query.message.edit_text(text=text, parse_mode=ParseMode.HTML, reply_markup=kb)
 
 
@@ -685,13 +1521,8 @@ async def toggle_send_updated(client, callback_query: CallbackQuery):
     set_send_updated_enabled(user_id, not current)
     filters_upd = load_user_filters_updated(user_id)
     current_filters_text = format_filters(filters_upd)
-    updated_enabled = get_send_updated_enabled(user_id)
-    status_btn_text = "Last Updated: ON ✅" if updated_enabled else "Last Updated: OFF ❌"
     text = SETTINGS_SUBMENU_TEXT_UPDATED.format(current_filters=current_filters_text)
-    kb = InlineKeyboardMarkup([
-        [InlineKeyboardButton(status_btn_text, callback_data="toggle_send_updated")],
-        [InlineKeyboardButton("◀️ Back", callback_data="back_to_settings_main")]
-    ])
+    kb = settings_submenu_keyboard_updated(user_id)
     try:
         await callback_query.message.edit_text(text=text, parse_mode=ParseMode.HTML, reply_markup=kb)
     except MessageNotModified:
@@ -706,13 +1537,36 @@ async def toggle_send_new(client, callback_query: CallbackQuery):
     set_send_new_enabled(user_id, not current)
     filters_n = load_user_filters_new(user_id)
     current_filters_text = format_filters(filters_n)
-    new_enabled = get_send_new_enabled(user_id)
-    status_btn_text = "Most Recent: ON ✅" if new_enabled else "Most Recent: OFF ❌"
     text = SETTINGS_SUBMENU_TEXT_NEW.format(current_filters=current_filters_text)
-    kb = InlineKeyboardMarkup([
-        [InlineKeyboardButton(status_btn_text, callback_data="toggle_send_new")],
-        [InlineKeyboardButton("◀️ Back", callback_data="back_to_settings_main")]
-    ])
+    kb = settings_submenu_keyboard_new(user_id)
+    try:
+        await callback_query.message.edit_text(text=text, parse_mode=ParseMode.HTML, reply_markup=kb)
+    except MessageNotModified:
+        pass
+    await callback_query.answer()
+
+
+@app.on_callback_query(filters.regex("^toggle_digest_updated$"))
+async def toggle_digest_updated(client, callback_query: CallbackQuery):
+    user_id = callback_query.from_user.id
+    set_digest_updated_enabled(user_id, not get_digest_updated_enabled(user_id))
+    current_filters_text = format_filters(load_user_filters_updated(user_id))
+    text = SETTINGS_SUBMENU_TEXT_UPDATED.format(current_filters=current_filters_text)
+    kb = settings_submenu_keyboard_updated(user_id)
+    try:
+        await callback_query.message.edit_text(text=text, parse_mode=ParseMode.HTML, reply_markup=kb)
+    except MessageNotModified:
+        pass
+    await callback_query.answer()
+
+
+@app.on_callback_query(filters.regex("^toggle_digest_new$"))
+async def toggle_digest_new(client, callback_query: CallbackQuery):
+    user_id = callback_query.from_user.id
+    set_digest_new_enabled(user_id, not get_digest_new_enabled(user_id))
+    current_filters_text = format_filters(load_user_filters_new(user_id))
+    text = SETTINGS_SUBMENU_TEXT_NEW.format(current_filters=current_filters_text)
+    kb = settings_submenu_keyboard_new(user_id)
     try:
         await callback_query.message.edit_text(text=text, parse_mode=ParseMode.HTML, reply_markup=kb)
     except MessageNotModified:
@@ -778,16 +1632,19 @@ async def add_game(client, message):
     await message.delete()
     steam_games = load_games(user_id)
     parts = message.text.strip().split(maxsplit=1)
+    tokens = re.split(r"[\s,]+", parts[1].strip()) if len(parts) == 2 else []
     if len(parts) != 2:
         resp = INVALID_ADD_FORMAT
+    elif len(tokens) > 1:
+        resp = await bulk_add_games(user_id, tokens)
     else:
         inp = parts[1]
         gid = extract_game_id(inp)
         if gid:
-            ok, nm = is_valid_game(gid)
+            ok, nm = await is_valid_game(gid)
             if ok:
                 if gid not in steam_games:
-                    ws = check_workshop_exists(gid, steam_api_key)
+                    ws = await check_workshop_exists(gid, steam_api_key)
                     if ws is True:
                         steam_games[gid] = nm
                         save_games(user_id, steam_games)
@@ -824,141 +1681,631 @@ async def remove_game(client, message):
         gid = parts[1]
         if gid in steam_games:
             rmv = steam_games.pop(gid)
-            save_games(user_id, steam_games)
-            data, user_data = get_user_data(user_id)
-            kn = user_data.get("known_items", {})
-            if gid in kn:
-                del kn[gid]
-            lt = user_data.get("last_items", {})
-            if gid in lt:
-                del lt[gid]
-            knn = user_data.get("known_items_new", {})
-            if gid in knn:
-                del knn[gid]
-            ltn = user_data.get("last_items_new", {})
-            if gid in ltn:
-                del ltn[gid]
-            user_data["known_items"] = kn
-            user_data["last_items"] = lt
-            user_data["known_items_new"] = knn
-            user_data["last_items_new"] = ltn
-            save_user_data(user_id, user_data)
+            remove_game_data(user_id, gid)
             resp = REMOVE_GAME_SUCCESS.format(game_id=gid, game_name=rmv)
         else:
             resp = REMOVE_GAME_NOT_FOUND.format(game_id=gid)
     await show_settings_menu(client, user_id, message, text_prefix=resp + "\n\n")
 
 
-async def monitor_workshops(client, user_id):
+async def validate_bulk_game(gid):
+    async with import_semaphore:
+        ok, nm = await is_valid_game(gid)
+        if not ok:
+            return None
+        ws = await check_workshop_exists(gid, steam_api_key)
+    return nm if ws is True else None
+
+
+async def bulk_add_games(user_id, tokens):
+    steam_games = load_games(user_id)
+    lines = []
+    if len(tokens) > IMPORT_MAX_GAMES:
+        tokens = tokens[:IMPORT_MAX_GAMES]
+        lines.append(BULK_ADD_TRUNCATED.format(limit=IMPORT_MAX_GAMES))
+    game_ids = [extract_game_id(t) for t in tokens if t]
+    unrecognized = game_ids.count(None)
+    game_ids = list(dict.fromkeys(gid for gid in game_ids if gid))
+    new_ids = [gid for gid in game_ids if gid not in steam_games]
+    names = await asyncio.gather(*(validate_bulk_game(gid) for gid in new_ids))
+    if is_user_monitoring(user_id):
+        return SET_DISABLED_DURING_MONITORING
+    steam_games = load_games(user_id)
+    added = {gid: nm for gid, nm in zip(new_ids, names) if nm is not None and gid not in steam_games}
+    if added:
+        steam_games.update(added)
+        save_games(user_id, steam_games)
+    lines.insert(0, BULK_ADD_RESULT.format(
+        added=len(added), total=len(game_ids), duplicates=len(game_ids) - len(new_ids)
+    ))
+    failed = [gid for gid, nm in zip(new_ids, names) if nm is None]
+    if failed:
+        lines.append(BULK_ADD_FAILED.format(game_ids=", ".join(f"<code>{gid}</code>" for gid in failed)))
+    if unrecognized:
+        lines.append(BULK_ADD_UNRECOGNIZED.format(count=unrecognized))
+    return "\n".join(lines)
+
+
+def parse_imported_filters(f_dict):
+    if not isinstance(f_dict, dict):
+        return {}
+    parsed = {}
+    for f_name, cond in f_dict.items():
+        if f_name not in FILTER_FIELDS or not isinstance(cond, list) or len(cond) != 2:
+            continue
+        op, value = cond
+        if op in (">", "<") and isinstance(value, (int, float)) and value >= 0:
+            parsed[f_name] = (op, value)
+    return parsed
+
+
+def parse_import_file(data):
+    text = data.decode("utf-8", errors="ignore").strip()
+    try:
+        doc = json.loads(text)
+    except ValueError:
+        return re.split(r"[\s,]+", text), None
+    if isinstance(doc, list):
+        return [str(gid) for gid in doc], None
+    if not isinstance(doc, dict):
+        return re.split(r"[\s,]+", doc if isinstance(doc, str) else text), None
+    games = doc.get("games", {})
+    if isinstance(games, dict):
+        tokens = list(games)
+    elif isinstance(games, list):
+        tokens = [str(gid) for gid in games]
+    else:
+        tokens = []
+    f = {feed: parse_imported_filters(doc[f"filters_{feed}"]) for feed in FEEDS if f"filters_{feed}" in doc}
+    return tokens, f
+
+
+@app.on_message(filters.private & filters.document)
+async def import_games(client, message):
+    user_id = message.from_user.id
+    if is_user_monitoring(user_id):
+        await message.delete()
+        w = await message.reply(SET_DISABLED_DURING_MONITORING, parse_mode=ParseMode.HTML)
+        await show_settings_menu(client, user_id)
+        await asyncio.sleep(12)
+        await client.delete_messages(chat_id=message.chat.id, message_ids=[w.id])
+        return
+    tokens = None
+    if message.document.file_size <= IMPORT_MAX_BYTES:
+        try:
+            data = await message.download(in_memory=True)
+            tokens, f = parse_import_file(bytes(data.getbuffer()))
+        except Exception as e:
+            print("import_games error:", e)
+    await message.delete()
+    if not tokens:
+        resp = IMPORT_FILE_INVALID
+    else:
+        resp = await bulk_add_games(user_id, tokens)
+        if f and not is_user_monitoring(user_id):
+            if "updated" in f:
+                save_user_filters_updated(user_id, f["updated"])
+            if "new" in f:
+                save_user_filters_new(user_id, f["new"])
+            resp += "\n" + IMPORT_FILTERS_DONE
+    await show_settings_menu(client, user_id, message, text_prefix=resp + "\n\n")
+
+
+@app.on_message(filters.private & filters.user(ADMIN_IDS) & filters.regex(r"(?i)^top(\s+\d+)?$"))
+async def top_games(client, message):
+    parts = message.text.split()
+    limit = min(int(parts[1]), 30) if len(parts) == 2 else 10
+    lines = []
+    for rank, (gid, users, upd, new) in enumerate(top_watched_games(limit), start=1):
+        cached = get_cached_app(gid)
+        name = cached[1] if cached and cached[1] else "Unknown"
+        lines.append(TOP_GAMES_LINE.format(
+            rank=rank, game_id=gid, game_name=name, users=users, updated=upd, new=new
+        ))
+    txt = TOP_GAMES_HEADER + "\n" + "\n".join(lines) if lines else TOP_GAMES_EMPTY
+    await message.reply(txt, parse_mode=ParseMode.HTML)
+
+
+@app.on_message(filters.private & filters.regex(r"(?i)^export$"))
+async def export_games(client, message):
+    user_id = message.from_user.id
+    await message.delete()
+    doc = {
+        "games": load_games(user_id),
+        "filters_updated": load_user_filters_updated(user_id),
+        "filters_new": load_user_filters_new(user_id)
+    }
+    f = io.BytesIO(json.dumps(doc, indent=4, ensure_ascii=False).encode("utf-8"))
+    f.name = EXPORT_FILE_NAME
+    await client.send_document(user_id, f, caption=EXPORT_CAPTION)
+
+
+def schedule_feed(key, delay):
+    due = time.monotonic() + delay
+    feed_due[key] = due
+    heapq.heappush(feed_heap, (due, key))
+    feed_wakeup.set()
+
+
+def next_poll_interval(key, items):
+    stamps = [int(i.get(FEED_SORT_KEYS[key[1]], 0)) for i in items]
+    stamps = [s for s in stamps if s > 0]
+    if not stamps:
+        return feed_intervals.get(key, MIN_POLL_INTERVAL)
+    gap = max(time.time() - min(stamps), 0) / len(stamps)
+    interval = min(MAX_POLL_INTERVAL, max(MIN_POLL_INTERVAL, gap * POLL_RATE_FACTOR))
+    feed_intervals[key] = interval
+    return interval
+
+
+def subscribe_feeds(user_id, games, stagger=0):
+    for gid in games:
+        for feed in watched_feeds(user_id, gid):
+            key = (gid, FEED_QUERIES[feed][0])
+            delay = None
+            if key not in feed_subscribers:
+                feed_subscribers[key] = set()
+                delay = random.uniform(0, stagger)
+                if not POLL_WORKERS:
+                    schedule_feed(key, delay)
+            feed_subscribers[key].add(user_id)
+            mark = feed_marks.get(key)
+            last_time = get_game_state(user_id, gid, feed)["last_time"]
+            if last_time is not None:
+                feed_marks[key] = min(feed_marks.get(key, last_time), last_time)
+            if POLL_WORKERS and (delay is not None or feed_marks.get(key) != mark):
+                send_worker_command(key, ("subscribe", key, delay, feed_marks.get(key)))
+
+
+def unsubscribe_feeds(user_id, keys=None):
+    for key in list(feed_subscribers) if keys is None else keys:
+        subs = feed_subscribers.get(key)
+        if subs is None:
+            continue
+        subs.discard(user_id)
+        if not subs:
+            drop_feed(key)
+            if POLL_WORKERS:
+                send_worker_command(key, ("unsubscribe", key))
+
+
+def resubscribe_feed(user_id, feed, enabled):
+    if user_id not in user_queues:
+        return
+    games = load_games(user_id)
+    if enabled:
+        clear_game_state(user_id, feed=feed)
+        subscribe_feeds(user_id, games)
+    else:
+        unsubscribe_feeds(user_id, [(gid, FEED_QUERIES[feed][0]) for gid in games])
+
+
+def drop_feed(key):
+    feed_subscribers.pop(key, None)
+    feed_due.pop(key, None)
+    feed_intervals.pop(key, None)
+    feed_marks.pop(key, None)
+
+
+def dispatch_feed(key, items):
+    gid, q_type = key
+    queues = {uid: user_queues[uid] for uid in feed_subscribers.get(key, ()) if uid in user_queues}
+    matches = match_filters(queues, items, FEED_NAMES[q_type])
+    for uid, q in queues.items():
+        q.put_nowait((gid, q_type, items, matches[uid]))
+
+
+async def poll_feed(key, publish):
+    gid, q_type = key
+    sort_key = FEED_SORT_KEYS[q_type]
+    started = time.perf_counter()
+    try:
+        items = await fetch_workshop_items(q_type, gid, sort_key, feed_marks.get(key))
+    except Exception as e:
+        print("poll_feeds error:", e)
+        items = []
+    elapsed = time.perf_counter() - started
+    if items and key in feed_subscribers:
+        feed_marks[key] = max(feed_marks.get(key, 0), int(items[0].get(sort_key, 0)))
+    if publish is None:
+        FEED_POLL_SECONDS.observe(elapsed)
+        dispatch_feed(key, items)
+    elif key in feed_subscribers:
+        publish(key, items, elapsed)
+    if key in feed_subscribers:
+        schedule_feed(key, next_poll_interval(key, items))
+
+
+async def poll_feeds(publish=None):
+    polls = set()
+    try:
+        while True:
+            feed_wakeup.clear()
+            if not feed_heap:
+                await feed_wakeup.wait()
+                continue
+            due, key = feed_heap[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(feed_wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(feed_heap)
+            if feed_due.get(key) != due:
+                continue
+            await poll_semaphore.acquire()
+            task = asyncio.create_task(poll_feed(key, publish))
+            polls.add(task)
+            task.add_done_callback(polls.discard)
+            task.add_done_callback(lambda t: poll_semaphore.release())
+    finally:
+        for task in polls:
+            task.cancel()
+
+
+def worker_shard(key):
+    return zlib.crc32(str(key[0]).encode()) % POLL_WORKERS
+
+
+def send_worker_command(key, cmd):
+    if poll_workers:
+        poll_workers[worker_shard(key)][1].put(cmd)
+
+
+def start_poll_workers():
+    global worker_results, steam_limiter, STEAM_DAILY_BUDGET
+    share = POLL_WORKERS + 1
+    steam_limiter = TokenBucket(STEAM_REQUESTS_PER_SECOND / share, max(1, STEAM_BURST // share))
+    STEAM_DAILY_BUDGET //= share
+    ctx = multiprocessing.get_context("fork")
+    worker_results = ctx.Queue()
+    for n in range(POLL_WORKERS):
+        commands = ctx.Queue()
+        proc = ctx.Process(target=poll_worker, args=(commands, worker_results), name=f"poll-worker-{n}",
+                           daemon=True)
+        proc.start()
+        poll_workers.append((proc, commands))
+    print(f"Started {POLL_WORKERS} poll workers")
+
+
+def stop_poll_workers():
+    for proc, commands in poll_workers:
+        commands.put(None)
+    for proc, commands in poll_workers:
+        proc.join(5)
+        if proc.is_alive():
+            proc.terminate()
+        commands.cancel_join_thread()
+    poll_workers.clear()
+
+
+def take_steam_metrics():
+    counters = {k: v for k, v in steam_stats.items() if not k.startswith("budget_") and v}
+    for k in counters:
+        steam_stats[k] = 0
+    metrics = (counters, STEAM_RESPONSES.values, STEAM_REQUEST_SECONDS.values)
+    STEAM_RESPONSES.values = {}
+    STEAM_REQUEST_SECONDS.values = {}
+    return metrics
+
+
+def merge_steam_metrics(metrics):
+    counters, responses, request_seconds = metrics
+    for k, v in counters.items():
+        steam_stats[k] += v
+    STEAM_RESPONSES.merge(responses)
+    STEAM_REQUEST_SECONDS.merge(request_seconds)
+
+
+def next_worker_result():
+    try:
+        return worker_results.get(timeout=1)
+    except queue.Empty:
+        return None
+
+
+async def worker_results_loop():
+    loop = asyncio.get_running_loop()
+    while True:
+        result = await loop.run_in_executor(None, next_worker_result)
+        if result is None:
+            continue
+        key, items, elapsed, metrics = result
+        FEED_POLL_SECONDS.observe(elapsed)
+        merge_steam_metrics(metrics)
+        if key not in feed_subscribers:
+            continue
+        if items:
+            sort_key = FEED_SORT_KEYS[key[1]]
+            feed_marks[key] = max(feed_marks.get(key, 0), int(items[0].get(sort_key, 0)))
+        dispatch_feed(key, items)
+
+
+def next_worker_command(commands):
+    while True:
+        try:
+            return commands.get(timeout=5)
+        except queue.Empty:
+            if not multiprocessing.parent_process().is_alive():
+                return None
+
+
+def poll_worker(commands, results):
+    global http_session, http_semaphore, poll_semaphore, feed_wakeup
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    http_session = None
+    http_semaphore = asyncio.Semaphore(HTTP_MAX_CONCURRENCY)
+    poll_semaphore = asyncio.Semaphore(POLL_CONCURRENCY)
+    feed_wakeup = asyncio.Event()
+    take_steam_metrics()
+    asyncio.run(worker_main(commands, results))
+
+
+async def worker_main(commands, results):
+    loop = asyncio.get_running_loop()
+    poll_task = asyncio.create_task(poll_feeds(
+        lambda key, items, elapsed: results.put((key, items, elapsed, take_steam_metrics()))
+    ))
+    try:
+        while True:
+            cmd = await loop.run_in_executor(None, next_worker_command, commands)
+            if cmd is None:
+                break
+            if cmd[0] == "subscribe":
+                _, key, delay, mark = cmd
+                if key not in feed_subscribers:
+                    feed_subscribers[key] = set()
+                    schedule_feed(key, delay or 0)
+                if mark is not None:
+                    feed_marks[key] = mark
+            else:
+                drop_feed(cmd[1])
+    finally:
+        poll_task.cancel()
+        results.cancel_join_thread()
+        await close_http_session()
+
+
+async def monitor_workshops(client, user_id, stagger=0):
+    queue = asyncio.Queue()
+    user_queues[user_id] = queue
+    subscribe_feeds(user_id, load_games(user_id), stagger)
     try:
         while True:
+            gid, q_type, items, passed = await queue.get()
             if not is_user_monitoring(user_id):
                 break
+            started = time.perf_counter()
             steam_games = load_games(user_id)
-            for gid, gname in steam_games.items():
+            if gid not in steam_games:
+                continue
+            gname = steam_games[gid]
+            if q_type == FEED_QUERIES["updated"][0]:
                 last_upd = get_last_publishedfileid(user_id, gid)
-                last_new = get_last_publishedfileid_new(user_id, gid)
-                new_updated = await get_new_workshop_items(21, gid, last_upd, "time_updated")
-                new_new = await get_new_workshop_items(1, gid, last_new, "time_created")
+                new_updated = new_items_since(items, last_upd, get_last_item_time(user_id, gid), "time_updated")
+                ITEMS_DIFFED.inc(len(new_updated), feed="updated")
                 if new_updated:
-                    set_last_publishedfileid(user_id, gid, new_updated[0]['publishedfileid'])
-                if new_new:
-                    set_last_publishedfileid_new(user_id, gid, new_new[0]['publishedfileid'])
+                    set_last_publishedfileid(user_id, gid, new_updated[0]['publishedfileid'],
+                                             int(new_updated[0].get('time_updated', 0)))
                 known_items = load_game_items_info(user_id, gid)
-                known_items_new = load_game_items_info_new(user_id, gid)
                 first_updated = (last_upd is None)
-                first_new = (last_new is None)
                 if get_send_updated_enabled(user_id):
+                    if not first_updated:
+                        new_updated = await get_item_details(unseen_items(known_items, new_updated, "time_updated"))
                     for it in new_updated:
-                        await process_and_send_item(known_items, user_id, gid, gname, it, client, not first_updated, "updated")
+                        process_and_send_item(known_items, user_id, gid, gname, it, not first_updated, "updated",
+                                              passed)
                     save_game_items_info(user_id, gid, known_items)
+            else:
+                last_new = get_last_publishedfileid_new(user_id, gid)
+                new_new = new_items_since(items, last_new, get_last_item_time_new(user_id, gid), "time_created")
+                ITEMS_DIFFED.inc(len(new_new), feed="new")
+                if new_new:
+                    set_last_publishedfileid_new(user_id, gid, new_new[0]['publishedfileid'],
+                                                 int(new_new[0].get('time_created', 0)))
+                known_items_new = load_game_items_info_new(user_id, gid)
+                first_new = (last_new is None)
                 if get_send_new_enabled(user_id):
+                    if not first_new:
+                        new_new = await get_item_details(unseen_items(known_items_new, new_new, "time_created"))
                     for it in new_new:
-                        await process_and_send_item_new(known_items_new, user_id, gid, gname, it, client, not first_new, "new")
+                        process_and_send_item_new(known_items_new, user_id, gid, gname, it, not first_new, "new",
+                                                  passed)
                     save_game_items_info_new(user_id, gid, known_items_new)
-            await asyncio.sleep(10)
+            MONITOR_BATCH_SECONDS.observe(time.perf_counter() - started)
     except asyncio.CancelledError:
         pass
     except Exception as e:
         print("monitor_workshops error:", e)
-    finally:
         set_monitoring_status(user_id, False)
+    finally:
+        unsubscribe_feeds(user_id)
+        user_queues.pop(user_id, None)
         if user_id in running_tasks:
             del running_tasks[user_id]
 
 
-async def get_new_workshop_items(q_type, game_id, last_publishedfileid, sort_key):
-    prms = {
-        'key': steam_api_key,
-        'appid': game_id,
-        'query_type': q_type,
-        'numperpage': 10,
-        'page': 1,
-        'return_metadata': True,
-        'return_tags': True,
-        'return_kv_tags': True,
-        'return_previews': True,
-        'return_children': True,
-        'return_short_description': True,
-        'return_for_sale_data': True,
-        'return_details': True,
-        'return_vote_data': True,
-        'return_playtime_stats': 1,
-    }
-    url = 'https://api.steampowered.com/IPublishedFileService/QueryFiles/v1/'
-    try:
-        r = requests.get(url, params=prms)
-        r.raise_for_status()
-        data = r.json()
-        items = data.get('response', {}).get('publishedfiledetails', [])
-        if not items:
-            return []
-        items.sort(key=lambda x: x.get(sort_key, 0), reverse=True)
-        if not last_publishedfileid:
-            return items
-        new_items = []
-        for i in items:
+def new_items_since(items, last_publishedfileid, last_time, sort_key):
+    if not last_publishedfileid:
+        return items
+    new_items = []
+    for i in items:
+        if last_time is None:
             if i['publishedfileid'] == last_publishedfileid:
                 break
-            new_items.append(i)
-        return new_items
-    except:
+        else:
+            ts = int(i.get(sort_key, 0))
+            if ts < last_time:
+                break
+            if i['publishedfileid'] == last_publishedfileid and ts <= last_time:
+                break
+        new_items.append(i)
+    return new_items
+
+
+def unseen_items(known_items, items, sort_key):
+    return [i for i in items if int(i.get(sort_key, 0)) > known_items.get(i.get('publishedfileid'), 0)]
+
+
+async def stream_query_files(r, sort_key, since):
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    pos = None
+    items = []
+    async for chunk in r.content.iter_chunked(QUERY_FILES_CHUNK):
+        buf += text.decode(chunk)
+        if pos is None:
+            m = re.search(r'"publishedfiledetails"\s*:\s*\[', buf)
+            if m is None:
+                continue
+            pos = m.end()
+        while pos >= 0:
+            while pos < len(buf) and buf[pos] in ", \t\r\n":
+                pos += 1
+            if pos >= len(buf):
+                break
+            if buf[pos] == "]":
+                pos = -1
+                break
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break
+            item = {k: obj[k] for k in QUERY_FILES_FIELDS if k in obj}
+            items.append(item)
+            pos = end
+            if since is not None and int(item.get(sort_key, 0)) < since:
+                return items, None
+        if pos == -1:
+            break
+        if pos:
+            buf, pos = buf[pos:], 0
+    if pos is not None and pos >= 0:
+        raise ValueError("Truncated QueryFiles response")
+    async for chunk in r.content.iter_chunked(QUERY_FILES_CHUNK):
+        buf += text.decode(chunk)
+    m = re.search(r'"next_cursor"\s*:\s*"([^"]*)"', buf)
+    return items, m.group(1) if m else None
+
+
+async def fetch_workshop_items(q_type, game_id, sort_key, since=None):
+    url = f"{STEAM_API_URL}/IPublishedFileService/QueryFiles/v1/"
+    items = {}
+    cursor = '*'
+    try:
+        for _ in range(MAX_POLL_PAGES):
+            prms = {
+                'key': steam_api_key,
+                'appid': game_id,
+                'query_type': q_type,
+                'numperpage': POLL_PAGE_SIZE,
+                'cursor': cursor,
+                'return_details': True,
+                'return_short_description': True,
+            }
+            page, next_cursor = await steam_get(
+                url, prms, parse=lambda r: stream_query_files(r, sort_key, since)
+            )
+            for i in page:
+                items.setdefault(i.get('publishedfileid'), i)
+            if not page or since is None or not next_cursor or next_cursor == cursor:
+                break
+            if min(int(i.get(sort_key, 0)) for i in page) <= since:
+                break
+            cursor = next_cursor
+    except Exception as e:
+        steam_stats["failed"] += 1
+        print("fetch_workshop_items error:", e)
         return []
+    items = list(items.values())
+    items.sort(key=lambda x: int(x.get(sort_key, 0)), reverse=True)
+    return items
 
 
-async def process_and_send_item(known_items, user_id, gid, gname, item, client, send_if_ok, t):
+async def get_item_details(items):
+    if not items:
+        return []
+    keys = [(i.get('publishedfileid'), int(i.get('time_updated', 0))) for i in items]
+    missing = [k for k in dict.fromkeys(keys) if k not in item_details and k not in details_inflight]
+    if missing:
+        fut = asyncio.get_running_loop().create_future()
+        for k in missing:
+            details_inflight[k] = fut
+        try:
+            await fetch_item_details(missing)
+        finally:
+            for k in missing:
+                details_inflight.pop(k, None)
+            fut.set_result(None)
+    for k in keys:
+        if k in details_inflight:
+            await details_inflight[k]
+        if k in item_details:
+            item_details.move_to_end(k)
+    return [item_details.get(k, i) for k, i in zip(keys, items)]
+
+
+async def fetch_item_details(keys):
+    url = f"{STEAM_API_URL}/IPublishedFileService/GetDetails/v1/"
+    for start in range(0, len(keys), DETAILS_BATCH_SIZE):
+        batch = keys[start:start + DETAILS_BATCH_SIZE]
+        prms = {
+            'key': steam_api_key,
+            'includetags': True,
+            'short_description': True,
+            'strip_description_bbcode': True,
+        }
+        for n, (pfid, _) in enumerate(batch):
+            prms[f'publishedfileids[{n}]'] = pfid
+        try:
+            data = await steam_get(url, prms)
+        except Exception as e:
+            steam_stats["failed"] += 1
+            print("fetch_item_details error:", e)
+            continue
+        found = {d.get('publishedfileid'): d for d in data.get('response', {}).get('publishedfiledetails', [])
+                 if d.get('result', 1) == 1}
+        for k in batch:
+            if k[0] in found:
+                item_details[k] = found[k[0]]
+        while len(item_details) > ITEM_DETAILS_CACHE_SIZE:
+            item_details.popitem(last=False)
+
+
+def process_and_send_item(known_items, user_id, gid, gname, item, send_if_ok, t, passed):
     pfid = item.get('publishedfileid')
     tu = int(item.get('time_updated', 0))
     old = known_items.get(pfid, 0)
     if tu > old:
-        known_items[pfid] = tu
-        while len(known_items) > 100:
-            oldest = min(known_items, key=known_items.get)
-            if oldest != pfid:
-                del known_items[oldest]
-            else:
-                break
-        if send_if_ok and check_filters_updated(user_id, item):
-            await send_workshop_item(client, user_id, gname, item, t)
+        known_items.add(pfid, tu)
+        if not send_if_ok:
+            return
+        if pfid in passed:
+            NOTIFICATIONS.inc(feed="updated", result="sent")
+            send_workshop_item(user_id, gname, item, t)
+        else:
+            NOTIFICATIONS.inc(feed="updated", result="filtered")
 
 
-async def process_and_send_item_new(known_items_new, user_id, gid, gname, item, client, send_if_ok, t):
+def process_and_send_item_new(known_items_new, user_id, gid, gname, item, send_if_ok, t, passed):
     pfid = item.get('publishedfileid')
     tc = int(item.get('time_created', 0))
     old = known_items_new.get(pfid, 0)
     if tc > old:
-        known_items_new[pfid] = tc
-        while len(known_items_new) > 100:
-            oldest = min(known_items_new, key=known_items_new.get)
-            if oldest != pfid:
-                del known_items_new[oldest]
-            else:
-                break
-        if send_if_ok and check_filters_new(user_id, item):
-            await send_workshop_item(client, user_id, gname, item, t)
+        known_items_new.add(pfid, tc)
+        if not send_if_ok:
+            return
+        if pfid in passed:
+            NOTIFICATIONS.inc(feed="new", result="sent")
+            send_workshop_item(user_id, gname, item, t)
+        else:
+            NOTIFICATIONS.inc(feed="new", result="filtered")
 
 
-async def send_workshop_item(client, user_id, gname, item, t):
+def format_workshop_item(gname, item, t):
     itype = " (updated)" if (t == "updated") else " (new)"
     ttl = item.get('title', 'No Title')
     fsb = int(item.get('file_size', 0))
@@ -988,7 +2335,149 @@ async def send_workshop_item(client, user_id, gname, item, t):
         item_url=url,
         item_type=itype
     )
-    await client.send_message(user_id, msg, parse_mode=ParseMode.HTML)
+    return msg
+
+
+def render_workshop_item(gname, item, t):
+    global rendered_bytes
+    pfid = item.get('publishedfileid')
+    tu = int(item.get('time_updated', 0))
+    if item_details.get((pfid, tu)) is not item:
+        return format_workshop_item(gname, item, t)
+    key = (pfid, tu, t, gname)
+    msg = rendered_messages.get(key)
+    if msg is not None:
+        rendered_messages.move_to_end(key)
+        RENDER_CACHE.inc(result="hit")
+        return msg
+    RENDER_CACHE.inc(result="miss")
+    msg = rendered_messages[key] = format_workshop_item(gname, item, t)
+    rendered_bytes += sys.getsizeof(msg)
+    while rendered_bytes > RENDER_CACHE_BYTES and len(rendered_messages) > 1:
+        _, old = rendered_messages.popitem(last=False)
+        rendered_bytes -= sys.getsizeof(old)
+    return msg
+
+
+def send_workshop_item(user_id, gname, item, t):
+    msg = render_workshop_item(gname, item, t)
+    digest_on = get_digest_updated_enabled(user_id) if t == "updated" else get_digest_new_enabled(user_id)
+    if digest_on:
+        add_to_digest(user_id, t, msg)
+    else:
+        enqueue_message(user_id, msg)
+
+
+def add_to_digest(user_id, t, msg):
+    key = (user_id, t)
+    buf = digest_buffers.get(key)
+    if buf is None:
+        buf = digest_buffers[key] = []
+        asyncio.get_running_loop().call_later(DIGEST_WINDOW, flush_digest, key, buf)
+    buf.append(msg)
+    if len(buf) >= DIGEST_MAX_ITEMS:
+        flush_digest(key)
+
+
+def flush_digest(key, expected=None):
+    if expected is not None and digest_buffers.get(key) is not expected:
+        return
+    buf = digest_buffers.pop(key, None)
+    if not buf:
+        return
+    user_id, t = key
+    if len(buf) == 1:
+        enqueue_message(user_id, buf[0])
+        return
+    pages = []
+    page = []
+    size = 0
+    for msg in buf:
+        if page and size + len(msg) + len(DIGEST_SEPARATOR) > MESSAGE_LIMIT - DIGEST_HEADER_RESERVE:
+            pages.append(page)
+            page = []
+            size = 0
+        page.append(msg)
+        size += len(msg) + len(DIGEST_SEPARATOR)
+    pages.append(page)
+    feed_name = "Last Updated" if t == "updated" else "Most Recent"
+    for n, page in enumerate(pages, start=1):
+        header = DIGEST_HEADER.format(
+            feed_name=feed_name,
+            count=len(buf),
+            page=f" ({n}/{len(pages)})" if len(pages) > 1 else ""
+        )
+        enqueue_message(user_id, header + DIGEST_SEPARATOR.join(page))
+
+
+def flush_all_digests():
+    for key in list(digest_buffers):
+        flush_digest(key)
+
+
+def enqueue_message(chat_id, text):
+    global delivery_pending
+    if delivery_pending >= DELIVERY_QUEUE_SIZE:
+        delivery_stats["dropped"] += 1
+        print(f"Delivery queue full, dropping message for {chat_id}")
+        return
+    q = delivery_chats.get(chat_id)
+    if q is None:
+        q = delivery_chats[chat_id] = deque()
+        ready_at = max(time.monotonic(), delivery_next.get(chat_id, 0))
+        heapq.heappush(delivery_ready, (ready_at, chat_id))
+        delivery_wakeup.set()
+    q.append(text)
+    delivery_pending += 1
+    delivery_stats["queued"] += 1
+
+
+async def delivery_worker(client):
+    global delivery_pending
+    while True:
+        delivery_wakeup.clear()
+        if not delivery_ready:
+            await delivery_wakeup.wait()
+            continue
+        ready_at, chat_id = delivery_ready[0]
+        delay = ready_at - time.monotonic()
+        if delay > 0:
+            try:
+                await asyncio.wait_for(delivery_wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        heapq.heappop(delivery_ready)
+        q = delivery_chats[chat_id]
+        text = q.popleft()
+        delivery_pending -= 1
+        await send_limiter.acquire()
+        next_at = time.monotonic() + CHAT_SEND_INTERVAL
+        try:
+            await client.send_message(chat_id, text, parse_mode=ParseMode.HTML)
+            delivery_stats["sent"] += 1
+        except FloodWait as e:
+            delivery_stats["flood_waits"] += 1
+            q.appendleft(text)
+            delivery_pending += 1
+            next_at = time.monotonic() + e.value
+        except Exception as e:
+            delivery_stats["failed"] += 1
+            print("delivery_worker error:", e)
+        delivery_next[chat_id] = next_at
+        if q:
+            heapq.heappush(delivery_ready, (next_at, chat_id))
+            delivery_wakeup.set()
+        else:
+            del delivery_chats[chat_id]
+
+
+async def drain_delivery():
+    deadline = time.monotonic() + DELIVERY_DRAIN_TIMEOUT
+    while delivery_chats and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    if delivery_pending:
+        print(f"Shutting down with {delivery_pending} undelivered messages")
 
 
 @app.on_message(filters.private & filters.incoming & ~filters.command("start") & ~filters.command("help"))
@@ -999,10 +2488,6 @@ async def handle_incoming_private(client, message):
     if mode == "settings_submenu_updated":
         if txt == "reset":
             save_user_filters_updated(user_id, {})
-            data, user_data = get_user_data(user_id)
-            user_data["known_items"] = {}
-            user_data["last_items"] = {}
-            save_user_data(user_id, user_data)
             f = load_user_filters_updated(user_id)
             ft = format_filters(f)
             show_txt = SETTINGS_SUBMENU_TEXT_UPDATED.format(current_filters=ft)
@@ -1013,11 +2498,7 @@ async def handle_incoming_private(client, message):
                     get_last_message_id(user_id, "settings"),
                     show_txt,
                     parse_mode=ParseMode.HTML,
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("Last Updated: ON ✅" if get_send_updated_enabled(user_id) else "Last Updated: OFF ❌",
-                                              callback_data="toggle_send_updated")],
-                        [InlineKeyboardButton("◀️ Back", callback_data="back_to_settings_main")]
-                    ])
+                    reply_markup=settings_submenu_keyboard_updated(user_id)
                 )
             except MessageNotModified:
                 pass
@@ -1028,8 +2509,7 @@ async def handle_incoming_private(client, message):
             if parsed is None:
                 return
             n, d = parsed
-            vf = ["size", "subs", "favs", "ltsubs", "ltfavs"]
-            if n not in vf:
+            if n not in FILTER_FIELDS:
                 return
             set_user_filter_updated(user_id, n, d)
             f = load_user_filters_updated(user_id)
@@ -1041,11 +2521,7 @@ async def handle_incoming_private(client, message):
                     get_last_message_id(user_id, "settings"),
                     show_txt,
                     parse_mode=ParseMode.HTML,
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("Last Updated: ON ✅" if get_send_updated_enabled(user_id) else "Last Updated: OFF ❌",
-                                              callback_data="toggle_send_updated")],
-                        [InlineKeyboardButton("◀️ Back", callback_data="back_to_settings_main")]
-                    ])
+                    reply_markup=settings_submenu_keyboard_updated(user_id)
                 )
             except MessageNotModified:
                 pass
@@ -1053,10 +2529,6 @@ async def handle_incoming_private(client, message):
     if mode == "settings_submenu_new":
         if txt == "reset":
             save_user_filters_new(user_id, {})
-            data, user_data = get_user_data(user_id)
-            user_data["known_items_new"] = {}
-            user_data["last_items_new"] = {}
-            save_user_data(user_id, user_data)
             f = load_user_filters_new(user_id)
             ft = format_filters(f)
             show_txt = SETTINGS_SUBMENU_TEXT_NEW.format(current_filters=ft)
@@ -1067,11 +2539,7 @@ async def handle_incoming_private(client, message):
                     get_last_message_id(user_id, "settings"),
                     show_txt,
                     parse_mode=ParseMode.HTML,
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("Most Recent: ON ✅" if get_send_new_enabled(user_id) else "Most Recent: OFF ❌",
-                                              callback_data="toggle_send_new")],
-                        [InlineKeyboardButton("◀️ Back", callback_data="back_to_settings_main")]
-                    ])
+                    reply_markup=settings_submenu_keyboard_new(user_id)
                 )
             except MessageNotModified:
                 pass
@@ -1082,8 +2550,7 @@ async def handle_incoming_private(client, message):
             if parsed is None:
                 return
             n, d = parsed
-            vf = ["size", "subs", "favs", "ltsubs", "ltfavs"]
-            if n not in vf:
+            if n not in FILTER_FIELDS:
                 return
             set_user_filter_new(user_id, n, d)
             f = load_user_filters_new(user_id)
@@ -1095,11 +2562,7 @@ async def handle_incoming_private(client, message):
                     get_last_message_id(user_id, "settings"),
                     show_txt,
                     parse_mode=ParseMode.HTML,
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("Most Recent: ON ✅" if get_send_new_enabled(user_id) else "Most Recent: OFF ❌",
-                                              callback_data="toggle_send_new")],
-                        [InlineKeyboardButton("◀️ Back", callback_data="back_to_settings_main")]
-                    ])
+                    reply_markup=settings_submenu_keyboard_new(user_id)
                 )
             except MessageNotModified:
                 pass
@@ -1107,5 +2570,72 @@ async def handle_incoming_private(client, message):
     await message.delete()
 
 
+def monitoring_user_ids():
+    flush_user_cache()
+    rows = db.execute("SELECT user_id FROM users WHERE json_extract(runtime, '$.is_monitoring')")
+    return [uid for uid, in rows]
+
+
+async def resume_monitors(client):
+    started = time.monotonic()
+    user_ids = monitoring_user_ids()
+    resumed = 0
+    for user_id in user_ids:
+        if user_id in running_tasks:
+            continue
+        if not load_games(user_id):
+            set_monitoring_status(user_id, False)
+            continue
+        running_tasks[user_id] = asyncio.create_task(monitor_workshops(client, user_id, RESUME_STAGGER))
+        resumed += 1
+    await asyncio.sleep(0)
+    print(f"Resumed monitoring for {resumed} users in {time.monotonic() - started:.2f}s")
+
+
+async def metrics_handler(request):
+    return web.Response(text=render_metrics(), content_type="text/plain")
+
+
+async def start_metrics_server():
+    if not METRICS_PORT:
+        return None
+    web_app = web.Application()
+    web_app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(web_app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+    return runner
+
+
+async def main():
+    prewarm_app_cache()
+    rebuild_game_index()
+    if POLL_WORKERS:
+        start_poll_workers()
+        poll_task = asyncio.create_task(worker_results_loop())
+    else:
+        poll_task = asyncio.create_task(poll_feeds())
+    metrics_runner = await start_metrics_server()
+    flush_task = asyncio.create_task(flush_loop())
+    try:
+        async with app:
+            delivery_tasks = [asyncio.create_task(delivery_worker(app)) for _ in range(DELIVERY_WORKERS)]
+            await resume_monitors(app)
+            await idle()
+            poll_task.cancel()
+            flush_all_digests()
+            await drain_delivery()
+            for t in delivery_tasks:
+                t.cancel()
+    finally:
+        poll_task.cancel()
+        stop_poll_workers()
+        flush_task.cancel()
+        close_storage()
+        await close_http_session()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+
+
 if __name__ == "__main__":
-    app.run()
\ No newline at end of file
+    app.run(main())
\ No newline at end of file